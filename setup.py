@@ -28,6 +28,9 @@ setup(
         'setuptools',
         'Flask',
     ],
+    extras_require={
+        'gevent': ['gevent'],
+    },
     entry_points="""
     [console_scripts]
     flask-ctl = presence_analyzer.script:run
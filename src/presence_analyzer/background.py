@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Warm-up and periodic refresh of data outside of requests.
+
+`start` is called by `script.make_app`:
+
+- WARM_UP 'eager' loads and indexes data before the app is returned,
+- WARM_UP 'background' does it in a thread, requests wait for it up to
+  WARM_UP_TIMEOUT seconds and get 503 after that,
+- REFRESH_INTERVAL above 0 starts a thread which reloads changed files
+  and recomputes derived values every that many seconds,
+- WATCH_FILES reloads DATA_CSV and DATA_XML of 'files' storage as soon
+  as they change, see `presence_analyzer.watcher`.
+
+With either of the last two, request threads use loaded data without
+checking the files.
+
+/api/v1/_ready reports whether the warm-up has finished and data has
+loaded, or loads again after a failure.
+"""
+import logging
+import threading
+
+from flask import abort, request
+
+from presence_analyzer.main import app
+from presence_analyzer import storage, watcher
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class Background(object):
+    """
+    Threads warming up and refreshing data of the app.
+    """
+
+    def __init__(self):
+        # set unless a background warm-up is running
+        self.ready = threading.Event()
+        self.ready.set()
+        # whether the last warm-up or refresh failed
+        self.failed = False
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.started = False
+        self.threads = []
+        self.watcher = None
+
+    def start(self):
+        """
+        Starts warm-up and refresher configured in app config, once.
+        """
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self.stopped.clear()
+        mode = app.config['WARM_UP']
+        if mode == 'eager':
+            self.warm_up()
+        elif mode == 'background':
+            self.ready.clear()
+            self.spawn(self.warm_up)
+        interval = app.config['REFRESH_INTERVAL']
+        if interval or app.config['WATCH_FILES']:
+            for cache in storage.SOURCES.itervalues():
+                cache.watched = True
+        if interval:
+            self.spawn(self.refresh, interval)
+        if app.config['WATCH_FILES']:
+            sources = {
+                watcher.filesystem_path(app.config[source]): source
+                for source in storage.SOURCES
+            }
+            self.watcher = watcher.watch(
+                sources,
+                lambda path: self.reload(sources[path]),
+                app.config['WATCH_DEBOUNCE'],
+                app.config['WATCH_POLL_INTERVAL'],
+            )
+
+    def spawn(self, target, *args):
+        """
+        Runs target in a daemon thread.
+        """
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def load(self):
+        """
+        Loads and indexes data, recording whether it has failed.
+        """
+        try:
+            storage.get_storage().warm_up()
+        except Exception:
+            self.failed = True
+            raise
+        self.failed = False
+
+    def warm_up(self):
+        """
+        Loads and indexes data, then releases requests held for it.
+        """
+        try:
+            self.load()
+        except Exception:  # pylint: disable=broad-except
+            # requests will load data themselves and report the error
+            log.exception('Warm-up failed')
+        finally:
+            self.ready.set()
+
+    def refresh(self, interval):
+        """
+        Reloads changed data every `interval` seconds until stopped.
+        """
+        while not self.stopped.wait(interval):
+            try:
+                self.load()
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Refreshing data failed')
+
+    def reload(self, source):
+        """
+        Reloads changed data source (config key) of 'files' storage, and
+        the rest of data if it failed to load before.
+        """
+        storage.file_storage.refresh(source)
+        if self.failed:
+            self.load()
+
+    def stop(self):
+        """
+        Stops the threads, so `start` can be called again.
+        """
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        for cache in storage.SOURCES.itervalues():
+            cache.watched = False
+        with self.lock:
+            self.started = False
+            self.failed = False
+
+
+background = Background()  # pylint: disable=invalid-name
+
+
+@app.before_request
+def wait_until_ready():
+    """
+    Holds requests until background warm-up finishes.
+    """
+    if request.endpoint == 'ready_view' or background.ready.is_set():
+        return
+    if not background.ready.wait(app.config['WARM_UP_TIMEOUT']):
+        abort(503)
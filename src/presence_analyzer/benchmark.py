@@ -0,0 +1,819 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks on synthetic data.
+
+Usage:
+    bin/python-console -m presence_analyzer.benchmark parser --users 500
+    bin/python-console -m presence_analyzer.benchmark suite --years 2 \
+        --output results.json --baseline previous.json
+    bin/python-console -m presence_analyzer.benchmark serving \
+        --connections 10 100 1000
+"""
+import os
+import sys
+import json
+import time
+import errno
+import random
+import select
+import socket
+import platform
+import datetime
+import argparse
+import shutil
+import resource
+import tempfile
+import multiprocessing
+from itertools import cycle
+
+import pkg_resources
+
+from presence_analyzer.main import app
+from presence_analyzer import background, parsing, storage, utils
+
+
+def generate_csv(path, users, days, seed=0):
+    """
+    Writes presence CSV with `days` working days for each of `users`.
+
+    Returns:
+        int: number of written rows.
+    """
+    rand = random.Random(seed)
+    first_day = datetime.date(2011, 1, 3)
+    workdays = [
+        first_day + datetime.timedelta(days=i)
+        for i in range(days * 7 // 5 + 7)
+        if (first_day + datetime.timedelta(days=i)).weekday() < 5
+    ][:days]
+    rows = 0
+    with open(path, 'w') as csvfile:
+        for user_id in range(10, 10 + users):
+            for day in workdays:
+                start = rand.randint(7 * 3600, 11 * 3600)
+                end = start + rand.randint(3600, 10 * 3600)
+                csvfile.write('{0},{1},{2},{3}\n'.format(
+                    user_id, day.isoformat(),
+                    format_seconds(start), format_seconds(end),
+                ))
+                rows += 1
+    return rows
+
+
+def generate_xml(path, users):
+    """
+    Writes users XML with the users of `generate_csv`.
+    """
+    with open(path, 'w') as xmlfile:
+        xmlfile.write(
+            '<?xml version="1.0" encoding="UTF-8" ?>\n<intranet>\n'
+            '<server><host>intranet.example.com</host><port>443</port>'
+            '<protocol>https</protocol></server>\n<users>\n'
+        )
+        for user_id in range(10, 10 + users):
+            xmlfile.write(
+                '<user id="{0}"><avatar>/api/images/users/{0}</avatar>'
+                '<name>User {0}</name></user>\n'.format(user_id)
+            )
+        xmlfile.write('</users>\n</intranet>\n')
+
+
+def format_seconds(seconds):
+    """
+    Formats seconds since midnight as `HH:MM:SS`.
+    """
+    return '{0:02d}:{1:02d}:{2:02d}'.format(
+        seconds // 3600, seconds // 60 % 60, seconds % 60
+    )
+
+
+def timed(function, *args, **kwargs):
+    """
+    Calls function and returns its result with the duration in seconds.
+    """
+    started = time.time()
+    result = function(*args, **kwargs)
+    return result, time.time() - started
+
+
+def benchmark_parser(path, rows):
+    """
+    Compares throughput of CSV parsers.
+
+    Returns:
+        dict: parser name mapped to rows per second.
+    """
+    results = {}
+    for parser in ('strict', 'fast'):
+        app.config['CSV_PARSER'] = parser
+        __, duration = timed(parsing.parse_data, path)
+        results[parser] = rows / duration
+    return results
+
+
+def benchmark_memory(path):
+    """
+    Compares memory used by presence data stores.
+
+    Returns:
+        dict: store name mapped to size in bytes.
+    """
+    results = {}
+    for store in ('dict', 'columns'):
+        app.config['DATA_STORE'] = store
+        results[store] = deep_getsizeof(parsing.parse_data(path))
+    return results
+
+
+def benchmark_parallel(path, rows, workers=(1, 2, 4)):
+    """
+    Compares throughput of loading data with different number of
+    processes.
+
+    Returns:
+        dict: number of processes mapped to rows per second.
+    """
+    results = {}
+    for count in workers:
+        app.config['DATA_CSV_WORKERS'] = count
+        __, duration = timed(parsing.load_data, path)
+        results[count] = rows / duration
+    app.config['DATA_CSV_WORKERS'] = 1
+    return results
+
+
+def benchmark_sqlite(path, queries=200, seed=0):
+    """
+    Compares weekday aggregates computed in Python from parsed CSV with
+    the ones computed by SQLite.
+
+    Returns:
+        dict: step name mapped to duration in seconds, queries are timed
+            per request.
+    """
+    app.config.update(DATA_CSV=path, DATA_STORE='columns')
+    db_path = path + '.sqlite'
+    rand = random.Random(seed)
+    results = {}
+    try:
+        __, results['python load'] = timed(parsing.parse_data, path)
+        __, results['sqlite import'] = timed(
+            storage.import_data, db_path, parsing.presence_rows(path), {}
+        )
+        backends = {
+            'python': storage.FileStorage(),
+            'sqlite': storage.SQLiteStorage(db_path),
+        }
+        user_ids = backends['sqlite'].user_ids()
+        first = datetime.date(2011, 3, 1)
+        last = datetime.date(2011, 9, 1)
+        for name, backend in sorted(backends.items()):
+            # warms up parsing, derived indexes and the connection
+            backend.user_aggregates(user_ids[0], first, last)
+            backend.user_aggregates(user_ids[0])
+            sample = [rand.choice(user_ids) for __ in range(queries)]
+            __, duration = timed(
+                lambda: [backend.user_aggregates(i) for i in sample]
+            )
+            results[name + ' all days'] = duration / queries
+            __, duration = timed(lambda: [
+                backend.user_aggregates(i, first, last) for i in sample
+            ])
+            results[name + ' date range'] = duration / queries
+    finally:
+        storage.presence_cache.clear()
+        os.remove(db_path)
+    return results
+
+
+WORKDAYS_PER_YEAR = 261
+
+# API endpoints measured by the suite, formatted with user_id
+ENDPOINTS = [
+    '/api/v1/users',
+    '/api/v1/mean_time_weekday/{0}',
+    '/api/v1/presence_weekday/{0}',
+    '/api/v1/presence_start_end/{0}',
+    '/api/v1/presence_weekday/{0}?from=2011-06-01&to=2011-12-31',
+    '/api/v1/presence_trend/{0}',
+    '/api/v1/user_avatar/{0}',
+    '/api/v1/batch?users={0}',
+    '/api/v1/batch',
+]
+
+
+def benchmark_suite(csv_path, xml_path, users, requests=200, seed=0):
+    """
+    Measures loading data, grouping functions and API endpoints.
+
+    Args:
+        csv_path (str): presence CSV from `generate_csv`.
+        xml_path (str): users XML from `generate_xml`.
+        users (int): number of users in the files.
+        requests (int): number of requests to every endpoint.
+
+    Endpoints are measured with the response cache off, so the results
+    show the cost of computing responses, and again in 'cached_endpoints'
+    with the cache on, where repeated URLs are served from it.
+
+    Returns:
+        dict: durations in seconds of loading and grouping, latency
+            percentiles in seconds and throughput of endpoints, peak
+            memory in bytes.
+    """
+    app.config.update(DATA_CSV=csv_path, DATA_XML=xml_path)
+    rand = random.Random(seed)
+    results = {
+        'load': {}, 'grouping': {}, 'endpoints': {}, 'cached_endpoints': {},
+    }
+
+    storage.presence_cache.clear()
+    storage.users_cache.clear()
+    data, results['load']['get_data'] = timed(storage.get_data)
+    __, results['load']['get_xml_data'] = timed(storage.get_xml_data)
+    __, results['load']['get_aggregates'] = timed(storage.get_aggregates)
+
+    for function in (
+            utils.group_by_weekday, utils.mean_start_stop,
+            utils.weekday_aggregates, utils.weekday_summary):
+        __, duration = timed(
+            lambda: [function(items) for items in data.itervalues()]
+        )
+        results['grouping'][function.__name__] = duration
+
+    client = app.test_client()
+    cache_size = app.config['RESPONSE_CACHE_SIZE']
+    for key, size in (('endpoints', 0), ('cached_endpoints', cache_size)):
+        app.config['RESPONSE_CACHE_SIZE'] = size
+        try:
+            for endpoint in ENDPOINTS:
+                urls = [
+                    endpoint.format(rand.randrange(10, 10 + users))
+                    for __ in range(requests)
+                ]
+                results[key][endpoint] = benchmark_endpoint(client, urls)
+        finally:
+            app.config['RESPONSE_CACHE_SIZE'] = cache_size
+
+    results['peak_memory'] = peak_memory()
+    return results
+
+
+def benchmark_endpoint(client, urls):
+    """
+    Requests urls one after another.
+
+    Returns:
+        dict: latency percentiles and mean in seconds, throughput in
+            requests per second.
+    """
+    # derived indexes are built on first use
+    client.get(urls[0], buffered=True)
+    latencies = []
+    started = time.time()
+    for url in urls:
+        # buffered, so streamed bodies are generated too
+        __, duration = timed(client.get, url, buffered=True)
+        latencies.append(duration)
+    total = time.time() - started
+    latencies.sort()
+    return dict(
+        {
+            'p{0}'.format(percent): utils.percentile(latencies, percent)
+            for percent in (50, 90, 99)
+        },
+        mean=utils.mean(latencies),
+        throughput=len(urls) / total,
+    )
+
+
+def peak_memory():
+    """
+    Returns peak resident memory of the process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def suite_report(results, users, days, rows):
+    """
+    Returns suite results with the version and the scale they were
+    measured at, ready to be saved as JSON.
+    """
+    try:
+        version = pkg_resources.get_distribution('presence_analyzer').version
+    except pkg_resources.DistributionNotFound:
+        version = None
+    return {
+        'version': version,
+        'python': platform.python_version(),
+        'date': datetime.datetime.utcnow().isoformat(),
+        'scale': {'users': users, 'days': days, 'rows': rows},
+        'results': results,
+    }
+
+
+def compare_results(baseline, results, prefix=''):
+    """
+    Yields (name, baseline value, value, ratio) of every number in
+    results which is also in baseline.
+    """
+    for key, value in sorted(results.iteritems()):
+        name = prefix + key
+        if key not in baseline:
+            continue
+        if isinstance(value, dict):
+            for row in compare_results(baseline[key], value, name + ' '):
+                yield row
+        elif baseline[key]:
+            yield name, baseline[key], value, float(value) / baseline[key]
+
+
+def benchmark_dataplane(csv_path, xml_path, processes=(1, 2, 4, 8)):
+    """
+    Compares memory of worker processes parsing data themselves with
+    workers attaching the shared data plane.
+
+    Every worker computes aggregates of all users for all days and for
+    a date range, then the proportional set size (PSS: private pages plus
+    the process share of shared ones) of all workers is summed. The PSS
+    of as many idle workers is subtracted, so only the data is measured.
+
+    Returns:
+        dict: mode ('files' with columns store or 'shared') mapped to
+            dict of number of processes mapped to data size in bytes.
+    """
+    directory = tempfile.mkdtemp()
+    app.config.update(
+        DATA_CSV=csv_path, DATA_XML=xml_path, DATA_PLANE=directory,
+        DATA_STORE='columns',
+    )
+    try:
+        # published in a child, so workers don't inherit parsed data
+        loader = multiprocessing.Process(
+            target=storage.publish_data_plane, args=(directory,)
+        )
+        loader.start()
+        loader.join()
+        # shares of pages inherited from this process depend on count
+        idle = {
+            count: sum(workers_memory(None, count)) for count in processes
+        }
+        results = {}
+        for mode in ('files', 'shared'):
+            results[mode] = {
+                count: sum(workers_memory(mode, count)) - idle[count]
+                for count in processes
+            }
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def workers_memory(mode, count):
+    """
+    Starts `count` workers loading data with STORAGE `mode` (nothing for
+    None) and returns PSS of every worker in bytes.
+    """
+    ready = multiprocessing.Queue()
+    done = multiprocessing.Event()
+    workers = [
+        multiprocessing.Process(target=plane_worker, args=(mode, ready, done))
+        for __ in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        pids = [ready.get() for __ in workers]
+        return [proportional_memory(pid) for pid in pids]
+    finally:
+        done.set()
+        for worker in workers:
+            worker.join()
+
+
+def plane_worker(mode, ready, done):
+    """
+    Computes aggregates of all users and waits until measured.
+    """
+    if mode is not None:
+        app.config['STORAGE'] = mode
+        with app.test_request_context():
+            backend = storage.get_storage()
+            for first in (None, datetime.date(2011, 6, 1)):
+                lookup = backend.aggregates_lookup(first, None)
+                for user_id in backend.user_ids():
+                    lookup(user_id)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def benchmark_serving(csv_path, xml_path, users, connections=(10, 100),
+                      duration=10.0, servers=('paste', 'gevent'), seed=0):
+    """
+    Compares Paste's thread pool with gevent serving API endpoints to
+    many concurrent keep-alive connections.
+
+    Every server runs in a child process with data loaded before serving
+    and watched for changes, the load comes from a single client process
+    multiplexing all connections.
+
+    Returns:
+        dict: server mapped to dict of number of connections mapped to
+            results of `http_load` with proportional set size of the
+            server process in bytes, or to None if it's not installed.
+    """
+    rand = random.Random(seed)
+    urls = [
+        rand.choice(ENDPOINTS).format(rand.randrange(10, 10 + users))
+        for __ in range(1000)
+    ]
+    # every connection takes a descriptor of both processes
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    results = {}
+    try:
+        for server in servers:
+            ready = multiprocessing.Queue()
+            child = multiprocessing.Process(
+                target=serving_child,
+                args=(server, csv_path, xml_path, ready),
+            )
+            child.start()
+            try:
+                port = ready.get()
+                if port is None:
+                    results[server] = None
+                    continue
+                results[server] = {}
+                for count in connections:
+                    result = http_load(
+                        ('127.0.0.1', port), urls, count, duration
+                    )
+                    result['memory'] = proportional_memory(child.pid)
+                    results[server][count] = result
+            finally:
+                child.terminate()
+                child.join()
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    return results
+
+
+def serving_child(server, csv_path, xml_path, ready):
+    """
+    Serves the app with `server` on a free port, which is put to `ready`
+    once it's listening, or puts None if the server is not installed.
+    """
+    # Paste prints errors of connections closed by the load to stdout
+    sys.stdout = sys.stderr = open(os.devnull, 'w')
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    app.config.update(
+        DATA_CSV=csv_path, DATA_XML=xml_path, WARM_UP='eager',
+        WATCH_FILES=True,
+    )
+    background.background.start()
+    try:
+        if server == 'paste':
+            from paste import httpserver
+            # threads as in deploy.ini, keep-alive as gevent does
+            instance = httpserver.serve(
+                app, '127.0.0.1', port, start_loop=False,
+                protocol_version='HTTP/1.1', use_threadpool=True,
+                threadpool_workers=50, request_queue_size=1024,
+            )
+        else:
+            from presence_analyzer import serving
+            instance = serving.make_server(app, '127.0.0.1', port)
+            instance.init_socket()
+    except (ImportError, RuntimeError):
+        ready.put(None)
+        return
+    ready.put(port)
+    instance.serve_forever()
+
+
+def http_load(address, urls, connections, duration):
+    """
+    Keeps `connections` connections requesting `urls` in turns for
+    `duration` seconds, reusing connections the server keeps alive.
+
+    Returns:
+        dict: number of responses and errors (failed connections and
+            statuses other than 200), throughput and latency percentiles
+            in seconds.
+    """
+    poller = select.poll()
+    clients = {}
+    latencies = []
+    errors = [0]
+    paths = cycle(urls)
+
+    def connect():
+        """
+        Opens new connection and sends its first request.
+        """
+        client = LoadClient(address, next(paths))
+        clients[client.sock.fileno()] = client
+        poller.register(client.sock, select.POLLOUT)
+
+    def close(client):
+        """
+        Closes connection and opens a new one instead.
+        """
+        poller.unregister(client.sock)
+        del clients[client.sock.fileno()]
+        client.sock.close()
+        connect()
+
+    for __ in range(connections):
+        connect()
+    started = time.time()
+    while time.time() - started < duration:
+        for fd, event in poller.poll(100):
+            client = clients[fd]
+            try:
+                if event & select.POLLOUT:
+                    if client.send():
+                        poller.modify(fd, select.POLLIN)
+                    continue
+                response = client.receive()
+            except socket.error:
+                errors[0] += 1
+                close(client)
+                continue
+            if response is None:
+                continue
+            status, keep_alive = response
+            latencies.append(time.time() - client.sent_at)
+            if status != 200:
+                errors[0] += 1
+            if keep_alive:
+                client.request(next(paths))
+                poller.modify(fd, select.POLLOUT)
+            else:
+                close(client)
+    total = time.time() - started
+    for client in clients.values():
+        client.sock.close()
+    latencies.sort()
+    return dict(
+        {
+            'p{0}'.format(percent): utils.percentile(latencies, percent)
+            for percent in (50, 90, 99)
+        } if latencies else {},
+        responses=len(latencies),
+        errors=errors[0],
+        throughput=len(latencies) / total,
+    )
+
+
+class LoadClient(object):
+    """
+    Non-blocking HTTP/1.1 connection of `http_load`.
+    """
+
+    def __init__(self, address, path):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        code = self.sock.connect_ex(address)
+        if code not in (0, errno.EINPROGRESS):
+            raise socket.error(code, os.strerror(code))
+        self.request(path)
+
+    def request(self, path):
+        """
+        Prepares request of path to send.
+        """
+        self.output = (
+            'GET {0} HTTP/1.1\r\nHost: localhost\r\n'
+            'Connection: keep-alive\r\n\r\n'.format(path)
+        )
+        self.received = ''
+        self.sent_at = time.time()
+
+    def send(self):
+        """
+        Sends part of the request, returns True when all is sent.
+        """
+        sent = self.sock.send(self.output)
+        self.output = self.output[sent:]
+        return not self.output
+
+    def receive(self):
+        """
+        Reads part of the response.
+
+        Returns:
+            tuple: status and whether connection is kept alive, once
+                the whole response is read, None before.
+
+        Raises:
+            socket.error: if connection is closed before that.
+        """
+        data = self.sock.recv(64 * 1024)
+        self.received += data
+        head, separator, body = self.received.partition('\r\n\r\n')
+        if not separator:
+            if not data:
+                raise socket.error(errno.ECONNRESET, 'Connection closed')
+            return None
+        lines = head.split('\r\n')
+        version, status = lines[0].split(' ', 2)[:2]
+        headers = dict(
+            (name.strip().lower(), value.strip())
+            for name, __, value in (line.partition(':') for line in lines[1:])
+        )
+        connection = headers.get('connection', '').lower()
+        if 'content-length' in headers or \
+                headers.get('transfer-encoding') == 'chunked':
+            if not self.complete(body, headers):
+                if not data:
+                    raise socket.error(errno.ECONNRESET, 'Connection closed')
+                return None
+            keep_alive = connection == 'keep-alive' or (
+                version == 'HTTP/1.1' and connection != 'close'
+            )
+        elif data:
+            # body ends when the server closes the connection
+            return None
+        else:
+            keep_alive = False
+        return int(status), keep_alive
+
+    @staticmethod
+    def complete(body, headers):
+        """
+        Tells whether body with Content-Length or chunked is all read.
+        """
+        if 'content-length' in headers:
+            return len(body) >= int(headers['content-length'])
+        # JSON chunks don't end with a line break, unlike the last chunk
+        return body == '0\r\n\r\n' or body.endswith('\r\n0\r\n\r\n')
+
+
+def proportional_memory(pid):
+    """
+    Returns proportional set size of process in bytes (Linux only).
+    """
+    total = 0
+    with open('/proc/{0}/smaps'.format(pid)) as smaps:
+        for line in smaps:
+            if line.startswith('Pss:'):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def deep_getsizeof(obj, seen=None):
+    """
+    Returns size in bytes of object and everything it references.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            deep_getsizeof(key, seen) + deep_getsizeof(value, seen)
+            for key, value in obj.iteritems()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+    else:
+        if hasattr(obj, '__dict__'):
+            size += deep_getsizeof(obj.__dict__, seen)
+        size += sum(
+            deep_getsizeof(getattr(obj, name), seen)
+            for name in getattr(type(obj), '__slots__', ())
+            if hasattr(obj, name)
+        )
+    return size
+
+
+def main(argv=None):
+    """
+    Runs benchmarks from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'benchmark',
+        choices=[
+            'parser', 'memory', 'parallel', 'sqlite', 'suite', 'dataplane',
+            'serving',
+        ],
+    )
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--days', type=int, default=4000)
+    parser.add_argument(
+        '--years', type=float, help='working days as years, overrides --days'
+    )
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--output', help='suite results JSON file')
+    parser.add_argument('--baseline', help='suite results to compare with')
+    parser.add_argument(
+        '--connections', type=int, nargs='+', default=[10, 100],
+        help='concurrent connections of serving benchmark',
+    )
+    parser.add_argument(
+        '--duration', type=float, default=10.0,
+        help='seconds of load at every number of connections',
+    )
+    args = parser.parse_args(argv)
+    if args.years:
+        args.days = int(args.years * WORKDAYS_PER_YEAR)
+
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    os.close(handle)
+    try:
+        rows = generate_csv(path, args.users, args.days)
+        if args.benchmark == 'parser':
+            for name, speed in sorted(benchmark_parser(path, rows).items()):
+                print '{0:>8}: {1:,.0f} rows/s ({2} rows)'.format(
+                    name, speed, rows
+                )
+        elif args.benchmark == 'memory':
+            for name, size in sorted(benchmark_memory(path).items()):
+                print '{0:>8}: {1:,.1f} MB, {2:.0f} bytes/row'.format(
+                    name, size / 1024.0 ** 2, float(size) / rows
+                )
+        elif args.benchmark == 'parallel':
+            results = benchmark_parallel(path, rows)
+            for workers, speed in sorted(results.items()):
+                print '{0:>8}: {1:,.0f} rows/s ({2} rows)'.format(
+                    workers, speed, rows
+                )
+        elif args.benchmark == 'sqlite':
+            for name, duration in sorted(benchmark_sqlite(path).items()):
+                print '{0:>18}: {1:,.3f} ms ({2} rows)'.format(
+                    name, duration * 1000, rows
+                )
+        elif args.benchmark == 'suite':
+            xml_path = path + '.xml'
+            generate_xml(xml_path, args.users)
+            try:
+                results = benchmark_suite(
+                    path, xml_path, args.users, args.requests
+                )
+            finally:
+                os.remove(xml_path)
+            report = suite_report(results, args.users, args.days, rows)
+            if args.output:
+                with open(args.output, 'w') as output:
+                    json.dump(report, output, indent=2, sort_keys=True)
+            else:
+                print json.dumps(report, indent=2, sort_keys=True)
+            if args.baseline:
+                with open(args.baseline) as baseline:
+                    baseline = json.load(baseline)['results']
+                for name, old, new, ratio in compare_results(
+                        baseline, results):
+                    print '{0:<70} {1:>12.6g} {2:>12.6g} {3:>7.2f}x'.format(
+                        name, old, new, ratio
+                    )
+        elif args.benchmark == 'dataplane':
+            xml_path = path + '.xml'
+            generate_xml(xml_path, args.users)
+            try:
+                results = benchmark_dataplane(path, xml_path)
+            finally:
+                os.remove(xml_path)
+            for mode, sizes in sorted(results.items()):
+                for count, size in sorted(sizes.items()):
+                    print '{0:>8} x{1}: {2:,.1f} MB ({3} rows)'.format(
+                        mode, count, size / 1024.0 ** 2, rows
+                    )
+        elif args.benchmark == 'serving':
+            xml_path = path + '.xml'
+            generate_xml(xml_path, args.users)
+            try:
+                results = benchmark_serving(
+                    path, xml_path, args.users, args.connections,
+                    args.duration,
+                )
+            finally:
+                os.remove(xml_path)
+            for server, loads in sorted(results.items()):
+                if loads is None:
+                    print '{0:>8}: not installed'.format(server)
+                    continue
+                for count, load in sorted(loads.items()):
+                    print (
+                        '{0:>8} x{1}: {2:,.0f} req/s, p50 {3:.1f} ms, '
+                        'p99 {4:.1f} ms, {5} errors, {6:,.1f} MB'
+                    ).format(
+                        server, count, load['throughput'],
+                        load.get('p50', 0) * 1000, load.get('p99', 0) * 1000,
+                        load['errors'], load['memory'] / 1024.0 ** 2,
+                    )
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
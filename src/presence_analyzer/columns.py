@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Compact array-backed representation of presence data.
+"""
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Mapping
+from itertools import izip
+
+
+class UserColumns(Mapping):
+    """
+    Presence entries of a single user kept in three integer arrays sorted
+    by day: day ordinal, seconds from midnight to start and to end.
+
+    Behaves like the dict built by `storage.get_data` for a single user:
+    {datetime.date: {'start': datetime.time, 'end': datetime.time}}.
+    """
+    __slots__ = ('days', 'starts', 'ends')
+
+    def __init__(self, days, starts, ends):
+        """
+        Args:
+            days (array): day ordinals, sorted and unique; any integer
+                sequence with `tolist`, like a NumPy array, works too.
+            starts (array): seconds from midnight to start.
+            ends (array): seconds from midnight to end.
+        """
+        self.days = days
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.days)
+
+    def __iter__(self):
+        fromordinal = datetime.date.fromordinal
+        for day in self.days:
+            yield fromordinal(day)
+
+    def __getitem__(self, date):
+        try:
+            entry = self.find(date.toordinal())
+        except AttributeError:
+            entry = None
+        if entry is None:
+            raise KeyError(date)
+        return {
+            'start': seconds_to_time(entry[0]),
+            'end': seconds_to_time(entry[1]),
+        }
+
+    def find(self, day):
+        """
+        Returns (start seconds, end seconds) of entry for day ordinal,
+        or None if there's no entry.
+        """
+        i = bisect_left(self.days, day)
+        if i == len(self.days) or self.days[i] != day:
+            return None
+        return int(self.starts[i]), int(self.ends[i])
+
+    def between(self, first=None, last=None):
+        """
+        Returns `UserColumns` with entries between two day ordinals,
+        inclusive, unbounded for None. Slices of NumPy arrays are views.
+        """
+        low = 0 if first is None else bisect_left(self.days, first)
+        high = len(self.days) if last is None else \
+            bisect_right(self.days, last)
+        high = max(low, high)
+        return UserColumns(
+            self.days[low:high], self.starts[low:high], self.ends[low:high]
+        )
+
+    def rows(self):
+        """
+        Returns iterator of (day ordinal, start seconds, end seconds).
+        """
+        if isinstance(self.days, array):
+            return izip(self.days, self.starts, self.ends)
+        # e.g. NumPy arrays, which are much faster to convert as a whole
+        return izip(
+            self.days.tolist(), self.starts.tolist(), self.ends.tolist()
+        )
+
+
+class ColumnStore(Mapping):
+    """
+    Presence data of all users, mapping user_id to `UserColumns`.
+    """
+
+    def __init__(self, users):
+        """
+        Args:
+            users (dict): user_id mapped to `UserColumns`.
+        """
+        self.users = users
+
+    def __len__(self):
+        return len(self.users)
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def __getitem__(self, user_id):
+        return self.users[user_id]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds store from (user_id, day ordinal, start seconds, end seconds)
+        rows. For repeated days the last row wins, like in a dict.
+        """
+        columns = {}
+        for user_id, day, start, end in rows:
+            try:
+                days, starts, ends = columns[user_id]
+            except KeyError:
+                days, starts, ends = columns[user_id] = (
+                    array('i'), array('i'), array('i')
+                )
+            days.append(day)
+            starts.append(start)
+            ends.append(end)
+        return cls({
+            user_id: sorted_columns(*user_columns)
+            for user_id, user_columns in columns.iteritems()
+        })
+
+    def extended(self, rows):
+        """
+        Returns new store with (user_id, day ordinal, start seconds,
+        end seconds) rows added. Users without new rows are shared.
+        """
+        columns = {}
+        for user_id, day, start, end in rows:
+            if user_id not in columns:
+                old = self.users.get(user_id)
+                if old is None:
+                    columns[user_id] = (array('i'), array('i'), array('i'))
+                else:
+                    columns[user_id] = (
+                        copy_column(old.days),
+                        copy_column(old.starts),
+                        copy_column(old.ends),
+                    )
+            days, starts, ends = columns[user_id]
+            days.append(day)
+            starts.append(start)
+            ends.append(end)
+        users = dict(self.users)
+        for user_id, user_columns in columns.iteritems():
+            users[user_id] = sorted_columns(*user_columns)
+        return ColumnStore(users)
+
+
+class WeekdayIndex(object):
+    """
+    Presence entries of a single user split by weekday, with prefix sums
+    of presence, start and end seconds. Sums over any date range take two
+    bisections per weekday, no matter how long the history is.
+    """
+    __slots__ = ('weekdays',)
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows (iterable): (day ordinal, start seconds, end seconds)
+                tuples with unique days.
+        """
+        grouped = [[] for __ in range(7)]  # one list for every day in week
+        for row in rows:
+            grouped[(row[0] - 1) % 7].append(row)
+        self.weekdays = []
+        for weekday_rows in grouped:
+            weekday_rows.sort()
+            days = array('i')
+            totals, starts, ends = array('l', [0]), array('l', [0]), \
+                array('l', [0])
+            for day, start, end in weekday_rows:
+                days.append(day)
+                totals.append(totals[-1] + end - start)
+                starts.append(starts[-1] + start)
+                ends.append(ends[-1] + end)
+            self.weekdays.append((days, totals, starts, ends))
+
+    def aggregates(self, first=None, last=None):
+        """
+        Sums entries between two days by weekday.
+
+        Args:
+            first (int): ordinal of the first day, unbounded if None.
+            last (int): ordinal of the last day, unbounded if None.
+
+        Returns:
+            list: the same as `utils.weekday_aggregates`.
+        """
+        result = []
+        for days, totals, starts, ends in self.weekdays:
+            low = 0 if first is None else bisect_left(days, first)
+            high = len(days) if last is None else bisect_right(days, last)
+            high = max(low, high)
+            result.append([
+                high - low,
+                totals[high] - totals[low],
+                starts[high] - starts[low],
+                ends[high] - ends[low],
+            ])
+        return result
+
+
+class Timeline(object):
+    """
+    Presence entries of a single user sorted by day, with prefix sums of
+    presence seconds. Total presence between any two days takes two
+    bisections.
+    """
+    __slots__ = ('days', 'totals')
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows (iterable): (day ordinal, start seconds, end seconds)
+                tuples with unique days.
+        """
+        self.days = array('i')
+        self.totals = array('l', [0])
+        for day, start, end in sorted(rows):
+            self.days.append(day)
+            self.totals.append(self.totals[-1] + end - start)
+
+    def total(self, first, last):
+        """
+        Returns presence seconds between two day ordinals, inclusive.
+        """
+        low = bisect_left(self.days, first)
+        high = max(low, bisect_right(self.days, last))
+        return self.totals[high] - self.totals[low]
+
+
+def sorted_columns(days, starts, ends):
+    """
+    Sorts columns by day, keeping only the last entry of repeated days.
+
+    Returns:
+        UserColumns: sorted columns.
+    """
+    if all(days[i] < days[i + 1] for i in xrange(len(days) - 1)):
+        return UserColumns(days, starts, ends)
+    # sort is stable, so the last of equal days is the last one added
+    order = sorted(xrange(len(days)), key=days.__getitem__)
+    order = [
+        i for n, i in enumerate(order)
+        if n + 1 == len(order) or days[order[n + 1]] != days[i]
+    ]
+    return UserColumns(
+        array('i', (days[i] for i in order)),
+        array('i', (starts[i] for i in order)),
+        array('i', (ends[i] for i in order)),
+    )
+
+
+def copy_column(column):
+    """
+    Returns copy of integer column as array('i').
+    """
+    if isinstance(column, array):
+        return array('i', column)
+    return array('i', column.tolist())
+
+
+def seconds_to_time(seconds):
+    """
+    Converts seconds since midnight to datetime.time.
+    """
+    return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
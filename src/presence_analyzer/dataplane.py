@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Presence and user data shared by worker processes.
+
+A single loader (`flask-ctl dataplane`) publishes generations of data
+to the DATA_PLANE directory:
+
+    current -> gen-1445430000123-4567-0   symlink replaced atomically
+    gen-1445430000123-4567-0/
+        presence.snapshot                 see `presence_analyzer.snapshot`
+        users.json
+
+Workers attach the generation `current` points to read-only. Presence
+columns are memory-mapped, so all processes share a single copy of them
+in the OS page cache, and a worker attaches the new generation as soon as
+the link is replaced.
+"""
+import os
+import json
+import time
+import shutil
+import threading
+from itertools import count
+
+from presence_analyzer import snapshot
+
+# older generations are kept for workers which are still attaching them
+KEEP_GENERATIONS = 3
+# tells apart generations published by the loader in the same millisecond
+sequence = count()  # pylint: disable=invalid-name
+
+
+def publish(directory, store, users, source_size=0, source_mtime=0):
+    """
+    Writes new generation of data and makes it current.
+
+    Args:
+        directory (str): data plane directory.
+        store (ColumnStore): presence data.
+        users (dict): data about users, see `parsing.parse_xml_data`.
+        source_size (int): size of the CSV file the data comes from.
+        source_mtime (float): modification time of the CSV file.
+
+    Returns:
+        str: name of the generation.
+    """
+    name = 'gen-{0:.0f}-{1}-{2}'.format(
+        time.time() * 1000, os.getpid(), next(sequence)
+    )
+    path = os.path.join(directory, name)
+    os.mkdir(path)
+    snapshot.write(
+        os.path.join(path, 'presence.snapshot'),
+        store, source_size, source_mtime,
+    )
+    with open(os.path.join(path, 'users.json'), 'w') as users_file:
+        json.dump(users, users_file)
+    link = os.path.join(directory, 'current.{0}.tmp'.format(os.getpid()))
+    os.symlink(name, link)
+    os.rename(link, os.path.join(directory, 'current'))
+    prune(directory)
+    return name
+
+
+def current(directory):
+    """
+    Returns name of the current generation.
+
+    Raises:
+        OSError: if nothing was published yet.
+    """
+    return os.readlink(os.path.join(directory, 'current'))
+
+
+def prune(directory, keep=KEEP_GENERATIONS):
+    """
+    Removes all but the `keep` newest generations and the current one.
+    """
+    generations = sorted(
+        (name for name in os.listdir(directory) if name.startswith('gen-')),
+        key=lambda name: [int(part) for part in name.split('-')[1:]],
+    )
+    for name in generations[:-keep]:
+        if name != current(directory):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class Generation(object):
+    """
+    Attached generation of data.
+    """
+
+    def __init__(self, directory, name):
+        path = os.path.join(directory, name)
+        snapshot_path = os.path.join(path, 'presence.snapshot')
+        self.name = name
+        __, __, self.store = snapshot.read(snapshot_path, share=True)
+        with open(os.path.join(path, 'users.json')) as users_file:
+            self.users = json.load(users_file)
+        stat = os.stat(snapshot_path)
+        self.version = (
+            snapshot_path, stat.st_dev, stat.st_ino, stat.st_size,
+            stat.st_mtime,
+        )
+        self.derived = {}
+        self.derive_lock = threading.Lock()
+
+    def derive(self, function):
+        """
+        Returns result of `function` called with presence data, computed
+        once for the generation, also when requested by many threads.
+        """
+        if function not in self.derived:
+            with self.derive_lock:
+                if function not in self.derived:
+                    self.derived[function] = function(self.store)
+        return self.derived[function]
+
+
+class DataPlane(object):
+    """
+    Keeps the current generation attached.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): data plane directory.
+        """
+        self.directory = directory
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns current generation, attaching it if it has changed.
+        """
+        name = current(self.directory)
+        generation = self.generation
+        if generation is not None and generation.name == name:
+            return generation
+        with self.lock:
+            if self.generation is None or self.generation.name != name:
+                self.generation = Generation(self.directory, name)
+            return self.generation
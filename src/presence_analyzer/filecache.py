@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Parsed content of data files kept in memory, see `FileCache`.
+"""
+import os
+import logging
+import threading
+from time import time as now
+from collections import namedtuple
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+CacheEntry = namedtuple(  # pylint: disable=invalid-name
+    'CacheEntry', 'signature value derived offset marker'
+)
+
+
+# loader can return it to pass values derived while parsing to the cache
+LoadResult = namedtuple(  # pylint: disable=invalid-name
+    'LoadResult', 'value derived'
+)
+
+
+EMPTY_ENTRY = CacheEntry(None, None, {}, 0, '')
+
+
+MARKER_SIZE = 64
+
+
+class FileCache(object):
+    """
+    Keeps the parsed content of a file in memory.
+
+    The file is parsed again only when its identity (path, inode, size or
+    modification time) changes. Reloading is single-flight: threads which
+    notice the change while another thread is already parsing the file wait
+    for its result instead of parsing the file themselves.
+
+    Values derived from the content (e.g. aggregates) can be memoized with
+    `derive`, they are dropped together with the content when it's reloaded.
+
+    With `background` enabled a changed file is parsed in a separate thread
+    and callers keep getting the previous content until it's done. If the
+    loader raises one of `errors` (e.g. the file is half-written), the
+    previous content is kept until the file changes again.
+
+    With `extend` given, a file which was only appended to is not parsed
+    again: `extend` gets the cached content and the offset of the first
+    unprocessed line and parses the rest. A replaced or truncated file,
+    or one whose bytes just before that offset have changed, is parsed
+    from scratch.
+
+    With `watched` set, changes are looked for only by `refresh`, called
+    by a watcher (see `presence_analyzer.background`), and `get` returns
+    the loaded content without touching the file.
+    """
+
+    def __init__(self, loader, background=False, errors=(), extend=None):
+        """
+        Args:
+            loader (callable): function which takes a path and returns
+                the parsed content of the file.
+            background (bool): reload changed file in a separate thread.
+            errors (tuple): exceptions which mean that the file is broken.
+            extend (callable): function which takes content, derived values,
+                path and offset and returns content and derived values
+                updated with lines after offset, and the offset after
+                the last complete line.
+        """
+        self.loader = loader
+        self.background = background
+        self.errors = errors
+        self.extend = extend
+        self.lock = threading.Lock()
+        self.derive_lock = threading.Lock()
+        # replaced as a whole so readers never see a signature which
+        # doesn't match the value.
+        self.entry = EMPTY_ENTRY
+        self.failed = None
+        self.thread = None
+        self.reloads = 0
+        self.reloaded_at = None
+        self.watched = False
+
+    def get(self, path):
+        """
+        Returns parsed content of the file, reloading it if it has changed.
+        """
+        entry = self.entry
+        if self.watched and entry.signature is not None and \
+                entry.signature[0] == path:
+            return entry.value
+        signature = file_signature(path)
+        if signature in (entry.signature, self.failed):
+            return entry.value
+        if self.background and entry.signature is not None and \
+                entry.signature[0] == path:
+            self.reload_in_background(path)
+            return entry.value
+        with self.lock:
+            self.reload(path)
+        return self.entry.value
+
+    def version(self, path):
+        """
+        Returns signature of the file version which is currently served.
+        """
+        self.get(path)
+        return self.entry.signature
+
+    def derive(self, path, function):
+        """
+        Returns result of `function` called with the parsed content.
+
+        The result is computed once for every version of the file.
+        """
+        self.get(path)
+        entry = self.entry
+        if function not in entry.derived:
+            with self.derive_lock:
+                if function not in entry.derived:
+                    entry.derived[function] = function(entry.value)
+        return entry.derived[function]
+
+    def reload(self, path, prepare=()):
+        """
+        Parses the file if it has changed. Must be called with lock held.
+
+        Values derived by `prepare` functions are computed before the new
+        content is published, see `derive`.
+        """
+        signature = file_signature(path)
+        entry = self.entry
+        if signature in (entry.signature, self.failed):
+            return
+        try:
+            if self.is_appended(entry, signature):
+                # `derive` may add to it meanwhile
+                with self.derive_lock:
+                    derived = dict(entry.derived)
+                value, derived, offset = self.extend(
+                    entry.value, derived, path, entry.offset
+                )
+            else:
+                value, derived = self.loader(path), {}
+                if isinstance(value, LoadResult):
+                    value, derived = value
+                offset = self.extend and last_line_end(path, signature[3])
+        except self.errors:
+            if entry.signature is None or entry.signature[0] != path:
+                raise
+            log.warning(
+                'Broken file %s, keeping old data', path, exc_info=True
+            )
+            self.failed = signature
+            return
+        marker = read_marker(path, offset) if self.extend else ''
+        for function in prepare:
+            if function not in derived:
+                derived[function] = function(value)
+        self.entry = CacheEntry(signature, value, derived, offset, marker)
+        self.failed = None
+        self.reloads += 1
+        self.reloaded_at = now()
+
+    def is_appended(self, entry, signature):
+        """
+        Tells whether the cached file was only appended to since it was
+        loaded, so it's enough to parse lines after the cached offset.
+        """
+        if self.extend is None or entry.signature is None:
+            return False
+        # same path, device and inode, not shorter than processed part
+        if entry.signature[:3] != signature[:3] or \
+                signature[3] < entry.offset:
+            return False
+        return read_marker(signature[0], entry.offset) == entry.marker
+
+    def refresh(self, path, prepare=()):
+        """
+        Reloads the file in the current thread if it has changed, see
+        `reload`.
+        """
+        with self.lock:
+            self.reload(path, prepare)
+
+    def reload_in_background(self, path):
+        """
+        Starts reloading the file in a new thread unless one is running.
+        """
+        if not self.lock.acquire(False):
+            return
+
+        def target():
+            """
+            Reloads the file and releases the lock taken by the caller.
+            """
+            try:
+                self.reload(path)
+            except (IOError, OSError):
+                log.warning('Cannot reload %s', path, exc_info=True)
+            finally:
+                self.lock.release()
+
+        self.thread = threading.Thread(target=target)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def clear(self):
+        """
+        Drops cached content, so the next call will parse the file again.
+        """
+        with self.lock:
+            self.entry = EMPTY_ENTRY
+            self.failed = None
+
+
+def file_signature(path):
+    """
+    Returns tuple which changes whenever the file is modified or replaced.
+    """
+    stat = os.stat(path)
+    return (path, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+def last_line_end(path, size):
+    """
+    Returns offset just after the last newline in first `size` bytes.
+    """
+    with open(path, 'rb') as datafile:
+        end = size
+        while end > 0:
+            start = max(end - 4096, 0)
+            datafile.seek(start)
+            position = datafile.read(end - start).rfind('\n')
+            if position >= 0:
+                return start + position + 1
+            end = start
+    return 0
+
+
+def read_marker(path, offset):
+    """
+    Returns bytes preceding offset, used to tell appending from rewriting.
+    """
+    with open(path, 'rb') as datafile:
+        datafile.seek(max(offset - MARKER_SIZE, 0))
+        return datafile.read(min(offset, MARKER_SIZE))
@@ -6,3 +6,71 @@ from flask import Flask
 
 
 app = Flask(__name__)  # pylint: disable=invalid-name
+app.config.update(
+    # 'fast' parses the fixed-width CSV layout directly, 'strict' uses
+    # strptime for every row.
+    CSV_PARSER='fast',
+    # 'dict' keeps nested dicts of datetime objects, 'columns' keeps
+    # compact integer arrays (see presence_analyzer.columns).
+    DATA_STORE='dict',
+    # 'python' or 'numpy' (if installed) engine computing statistics.
+    STATS_ENGINE='python',
+    # Binary snapshot of DATA_CSV written by `flask-ctl snapshot`, used
+    # instead of parsing the CSV while it's up to date. It's memory-mapped,
+    # so processes share its pages, with or without NumPy.
+    DATA_SNAPSHOT=None,
+    # Number of processes parsing DATA_CSV, 1 parses it in the current one.
+    # They are forked only while no other thread runs: by flask-ctl
+    # commands and eager warm-up, reloads in a server parse in one process.
+    DATA_CSV_WORKERS=1,
+    # 'files' serves data parsed from DATA_CSV and DATA_XML, 'sqlite'
+    # queries DATA_DB written by `flask-ctl import`, 'shared' attaches
+    # data published to DATA_PLANE directory by `flask-ctl dataplane`.
+    STORAGE='files',
+    DATA_DB=None,
+    DATA_PLANE=None,
+    # Record durations of hot paths, served at /api/v1/_metrics and in
+    # Server-Timing headers.
+    METRICS=False,
+    # Run requests with `_profile` query argument under cProfile.
+    PROFILING=False,
+    # Seconds between stack samples of all threads, 0 disables sampling.
+    SAMPLING_INTERVAL=0,
+    # Directory of saved profiles and sampled stacks.
+    PROFILE_DIR=None,
+    # 'json' (standard library) or 'ujson' (if installed) encoder of API
+    # responses.
+    JSON_ENCODER='json',
+    # Responses of at least that many bytes are compressed for clients
+    # accepting gzip or deflate, None disables compression.
+    COMPRESS_MIN_SIZE=1024,
+    # Rendered API responses kept in memory: maximum number, total size
+    # of bodies in bytes and seconds they are reused for (None for no
+    # limit, RESPONSE_CACHE_SIZE 0 turns caching off), the least recently
+    # used are evicted first.
+    RESPONSE_CACHE_SIZE=1000,
+    RESPONSE_CACHE_BYTES=64 * 1024 * 1024,
+    RESPONSE_CACHE_TTL=None,
+    # None loads data on the first request, 'eager' when the app is made
+    # by `script.make_app` and 'background' in a thread started there,
+    # holding requests until it's done, for up to WARM_UP_TIMEOUT seconds.
+    WARM_UP=None,
+    WARM_UP_TIMEOUT=60,
+    # Seconds between reloads of changed data in a background thread,
+    # 0 makes requests check the files themselves.
+    REFRESH_INTERVAL=0,
+    # Reload DATA_CSV and DATA_XML when they change, using inotify or
+    # polling them every WATCH_POLL_INTERVAL seconds, once they have been
+    # unchanged for WATCH_DEBOUNCE seconds, or at the latest a few times
+    # that after the first change.
+    WATCH_FILES=False,
+    WATCH_DEBOUNCE=1.0,
+    WATCH_POLL_INTERVAL=5.0,
+    # Address of `flask-ctl serve --server=gevent` and number of threads
+    # running requests which may block, see presence_analyzer.serving.
+    SERVE_HOST='127.0.0.1',
+    SERVE_PORT=8080,
+    SERVE_THREADS=10,
+    # Cache-Control max-age in seconds of API responses.
+    API_MAX_AGE=0,
+)
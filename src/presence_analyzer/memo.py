@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded memo cache.
+
+`MemoCache` keeps values up to a number of entries and total size,
+evicting the least recently used ones, and optionally expires them after
+a time to live. Every entry belongs to a group (e.g. the data sources it
+was computed from) with a version; entries of a group are dropped as soon
+as `invalidate` sees a new version of it, instead of waiting for eviction.
+"""
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+MemoEntry = namedtuple(  # pylint: disable=invalid-name
+    'MemoEntry', 'value size group stored_at'
+)
+COUNTERS = ('hits', 'misses', 'evictions', 'expirations', 'invalidations')
+
+
+class MemoCache(object):
+    """
+    Thread-safe LRU cache with size accounting and hit/miss counters.
+    """
+
+    def __init__(self, limits):
+        """
+        Args:
+            limits (callable): function returning maximum number of
+                entries, maximum total size and time to live in seconds,
+                None for no limit. At most 0 entries turns caching off.
+                It's called on every `put` and `get`, so changes of config
+                apply at once.
+        """
+        self.limits = limits
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # from the least recently used
+        self.versions = {}  # group mapped to its current version
+        self.size = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns value stored under key, or None.
+        """
+        __, __, ttl = self.limits()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            if ttl is not None and time.time() - entry.stored_at > ttl:
+                self.size -= entry.size
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return None
+            self.entries[key] = entry  # now the most recently used
+            self.counters['hits'] += 1
+            return entry.value
+
+    def put(self, key, value, size, group=None):
+        """
+        Stores value of `size` bytes, evicting the least recently used
+        entries over the limits. Values larger than the whole cache are
+        not stored.
+        """
+        max_entries, max_bytes, __ = self.limits()
+        if max_entries == 0 or max_bytes is not None and size > max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self.entries[key] = MemoEntry(value, size, group, time.time())
+            self.size += size
+            while max_entries is not None and \
+                    len(self.entries) > max_entries or \
+                    max_bytes is not None and self.size > max_bytes:
+                __, entry = self.entries.popitem(last=False)
+                self.size -= entry.size
+                self.counters['evictions'] += 1
+
+    def invalidate(self, group, version):
+        """
+        Drops entries of group if its version differs from the last one.
+        """
+        if self.versions.get(group) == version:
+            return
+        with self.lock:
+            if self.versions.get(group) == version:
+                return
+            if group in self.versions:
+                for key, entry in self.entries.items():
+                    if entry.group == group:
+                        del self.entries[key]
+                        self.size -= entry.size
+                        self.counters['invalidations'] += 1
+            self.versions[group] = version
+
+    def clear(self):
+        """
+        Drops all entries, counters stay.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns counters with current number of entries and their size.
+        """
+        with self.lock:
+            return dict(self.counters, entries=len(self.entries),
+                        bytes=self.size)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Timing of hot paths and requests.
+
+Functions wrapped with `instrumented` record their call count and time.
+Totals are exposed in Prometheus text format by the `/api/v1/_metrics`
+view and calls made while handling a request are listed in its
+Server-Timing header. With METRICS disabled in config the wrapper only
+checks the flag and calls the function.
+
+Counters of memo caches (see `presence_analyzer.memo`) are exposed by
+the same view.
+"""
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+from flask import g, has_request_context, request
+
+from presence_analyzer.main import app
+
+PREFIX = 'presence_analyzer'
+
+lock = threading.Lock()  # pylint: disable=invalid-name
+# function name mapped to [count, total seconds]
+calls = {}  # pylint: disable=invalid-name
+# endpoint mapped to [count, total seconds]
+requests = {}  # pylint: disable=invalid-name
+
+
+def instrumented(function):
+    """
+    Records duration of every call of the wrapped function.
+    """
+    name = function.__name__
+
+    @wraps(function)
+    def inner(*args, **kwargs):
+        """
+        This docstring will be overridden by @wraps decorator.
+        """
+        if not app.config['METRICS']:
+            return function(*args, **kwargs)
+        started = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.time() - started
+            record(calls, name, duration)
+            if has_request_context():
+                timings = g.setdefault('timings', OrderedDict())
+                timings[name] = timings.get(name, 0) + duration
+    return inner
+
+
+def record(totals, name, duration):
+    """
+    Adds a call taking `duration` seconds to totals of `name`.
+    """
+    with lock:
+        total = totals.setdefault(name, [0, 0.0])
+        total[0] += 1
+        total[1] += duration
+
+
+def reset():
+    """
+    Drops all recorded timings.
+    """
+    with lock:
+        calls.clear()
+        requests.clear()
+
+
+@app.before_request
+def start_timer():
+    """
+    Remembers when handling of the request started.
+    """
+    if app.config['METRICS']:
+        g.started = time.time()
+
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Records request duration and adds Server-Timing header.
+    """
+    started = g.get('started')
+    if started is None:
+        return response
+    duration = time.time() - started
+    record(requests, request.endpoint or 'not_found', duration)
+    entries = [
+        '{0};dur={1:.3f}'.format(name, seconds * 1000)
+        for name, seconds in g.get('timings', {}).iteritems()
+    ]
+    entries.append('total;dur={0:.3f}'.format(duration * 1000))
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
+def prometheus_text():
+    """
+    Returns recorded timings in Prometheus text exposition format.
+    """
+    with lock:
+        families = [
+            ('function', 'function', dict(calls)),
+            ('request', 'endpoint', dict(requests)),
+        ]
+    lines = []
+    for family, label, totals in families:
+        metric = '{0}_{1}_duration_seconds'.format(PREFIX, family)
+        lines.append('# HELP {0} Time spent in {1} calls.'.format(
+            metric, family
+        ))
+        lines.append('# TYPE {0} summary'.format(metric))
+        for name, (count, total) in sorted(totals.iteritems()):
+            lines.append('{0}_count{{{1}="{2}"}} {3}'.format(
+                metric, label, name, count
+            ))
+            lines.append('{0}_sum{{{1}="{2}"}} {3!r}'.format(
+                metric, label, name, total
+            ))
+    return '\n'.join(lines) + '\n'
+
+
+def cache_text(name, stats):
+    """
+    Returns counters and size of a memo cache in Prometheus text format.
+
+    Args:
+        name (str): name of the cache in metric names.
+        stats (dict): result of `MemoCache.stats`.
+    """
+    lines = []
+    for key, value in sorted(stats.iteritems()):
+        if key in ('entries', 'bytes'):
+            metric, kind = '{0}_{1}_{2}'.format(PREFIX, name, key), 'gauge'
+        else:
+            metric = '{0}_{1}_{2}_total'.format(PREFIX, name, key)
+            kind = 'counter'
+        lines.append('# TYPE {0} {1}'.format(metric, kind))
+        lines.append('{0} {1}'.format(metric, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of the presence CSV and the users XML files.
+"""
+import csv
+import os
+import datetime
+import logging
+import threading
+import multiprocessing
+from operator import attrgetter
+from itertools import groupby
+from array import array
+from collections import namedtuple
+
+from lxml import etree
+from presence_analyzer.main import app
+from presence_analyzer.columns import (
+    ColumnStore,
+    UserColumns,
+    sorted_columns,
+    seconds_to_time,
+)
+from presence_analyzer import metrics, snapshot
+from presence_analyzer.filecache import LoadResult
+from presence_analyzer.utils import (
+    DERIVED_UPDATES,
+    build_aggregates,
+    ordinal_weekday,
+    seconds_since_midnight,
+)
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def parse_data(path):
+    """
+    Extracts presence data from CSV file and groups it by user_id.
+
+    It creates structure like this:
+    data = {
+        'user_id': {
+            datetime.date(2013, 10, 1): {
+                'start': datetime.time(9, 0, 0),
+                'end': datetime.time(17, 30, 0),
+            },
+            datetime.date(2013, 10, 2): {
+                'start': datetime.time(8, 30, 0),
+                'end': datetime.time(16, 45, 0),
+            },
+        }
+    }
+
+    With DATA_STORE set to 'columns' a `ColumnStore` with the same
+    interface is returned instead. It's also returned when DATA_SNAPSHOT
+    holds an up to date snapshot of the file, which is loaded instead.
+    """
+    return load_data(path).value
+
+
+@metrics.instrumented
+def load_data(path):
+    """
+    Loads presence data, see `parse_data`.
+
+    With DATA_CSV_WORKERS above 1 the file is parsed by a pool of
+    processes, which also compute aggregates on the way, if it's safe
+    to fork, see `can_fork`.
+
+    Returns:
+        LoadResult: presence data and values derived from it.
+    """
+    if app.config['DATA_SNAPSHOT']:
+        store = snapshot.load(app.config['DATA_SNAPSHOT'], path)
+        if store is not None:
+            return LoadResult(store, {})
+
+    if app.config['DATA_CSV_WORKERS'] > 1 and can_fork():
+        store, derived = parse_parallel(path, app.config['DATA_CSV_WORKERS'])
+        if app.config['DATA_STORE'] != 'columns':
+            store = columns_to_dict(store)
+        return LoadResult(store, derived)
+
+    if app.config['DATA_STORE'] == 'columns':
+        return LoadResult(parse_columns(path), {})
+
+    return LoadResult(collect_presence(iter_presence(path)), {})
+
+
+def parse_columns(path):
+    """
+    Extracts presence data from CSV file into `ColumnStore`.
+    """
+    return ColumnStore.from_rows(
+        (
+            user_id,
+            day.toordinal(),
+            seconds_since_midnight(start),
+            seconds_since_midnight(end),
+        )
+        for user_id, day, start, end in iter_presence(path)
+    )
+
+
+def can_fork():
+    """
+    Tells whether worker processes can be forked safely: no other thread
+    runs, so none holds a lock (e.g. of logging or a cache) which would
+    stay locked forever in the child.
+
+    That's the case in `flask-ctl` commands and during eager warm-up,
+    but not in threads of the server or the background refresher.
+    """
+    return threading.active_count() == 1
+
+
+def parse_parallel(path, workers):
+    """
+    Parses CSV file split into byte ranges in a pool of processes.
+
+    Args:
+        path (str): CSV file path.
+        workers (int): number of processes.
+
+    Returns:
+        tuple: `ColumnStore` and derived values for `filecache.FileCache`.
+    """
+    ranges = split_ranges(path, workers)
+    pool = multiprocessing.Pool(min(workers, len(ranges)) or 1)
+    try:
+        parts = pool.map(
+            parse_range, [(path, start, end) for start, end in ranges]
+        )
+    finally:
+        pool.close()
+        pool.join()
+    return merge_parts(parts)
+
+
+def split_ranges(path, parts):
+    """
+    Splits file into byte ranges of similar size ending with newlines.
+
+    Returns:
+        list: (start, end) offsets.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as datafile:
+        for part in range(1, parts + 1):
+            if start >= size:
+                break
+            datafile.seek(max(start, size * part // parts))
+            datafile.readline()
+            end = min(datafile.tell(), size)
+            if part == parts:
+                end = size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_range(args):
+    """
+    Parses byte range of CSV file, runs in a worker process.
+
+    Args:
+        args (tuple): path, start and end offset.
+
+    Returns:
+        tuple: user_id mapped to packed day, start and end columns,
+            aggregates of the range (see `build_aggregates`), number of rows.
+    """
+    path, start, end = args
+    with open(path, 'rb') as csvfile:
+        csvfile.seek(start)
+        chunk = csvfile.read(end - start)
+    columns = {}
+    aggregates = {}
+    rows = 0
+    for user_id, day, start_time, end_time in parse_rows(chunk.splitlines()):
+        if user_id not in columns:
+            columns[user_id] = (array('i'), array('i'), array('i'))
+            aggregates[user_id] = [[0, 0, 0, 0] for __ in range(7)]
+        day = day.toordinal()
+        start_time = seconds_since_midnight(start_time)
+        end_time = seconds_since_midnight(end_time)
+        days, starts, ends = columns[user_id]
+        days.append(day)
+        starts.append(start_time)
+        ends.append(end_time)
+        weekday = aggregates[user_id][ordinal_weekday(day)]
+        weekday[0] += 1
+        weekday[1] += end_time - start_time
+        weekday[2] += start_time
+        weekday[3] += end_time
+        rows += 1
+    # arrays are pickled as lists, strings are much cheaper to pass
+    packed = {
+        user_id: tuple(column.tostring() for column in user_columns)
+        for user_id, user_columns in columns.iteritems()
+    }
+    return packed, aggregates, rows
+
+
+def merge_parts(parts):
+    """
+    Merges results of `parse_range` in the order of ranges.
+
+    Returns:
+        tuple: `ColumnStore` and derived values for `filecache.FileCache`.
+    """
+    columns = {}
+    aggregates = {}
+    rows = 0
+    for packed, part_aggregates, part_rows in parts:
+        for user_id, user_columns in packed.iteritems():
+            if user_id not in columns:
+                columns[user_id] = (array('i'), array('i'), array('i'))
+                aggregates[user_id] = [[0, 0, 0, 0] for __ in range(7)]
+            for column, data in zip(columns[user_id], user_columns):
+                column.fromstring(data)
+            for weekday, part_weekday in zip(
+                    aggregates[user_id], part_aggregates[user_id]):
+                for i, value in enumerate(part_weekday):
+                    weekday[i] += value
+        rows += part_rows
+    store = ColumnStore({
+        user_id: sorted_columns(*user_columns)
+        for user_id, user_columns in columns.iteritems()
+    })
+    # repeated days are replaced, so summed aggregates would be wrong
+    if sum(len(user_columns) for user_columns in store.itervalues()) != rows:
+        return store, {}
+    return store, {build_aggregates: aggregates}
+
+
+def columns_to_dict(store):
+    """
+    Converts `ColumnStore` to the structure returned by `storage.get_data`.
+    """
+    dates = ParseCache(datetime.date.fromordinal)
+    times = ParseCache(seconds_to_time)
+    return {
+        user_id: {
+            dates[day]: {'start': times[start], 'end': times[end]}
+            for day, start, end in user_columns.rows()
+        }
+        for user_id, user_columns in store.iteritems()
+    }
+
+
+Presence = namedtuple(  # pylint: disable=invalid-name
+    'Presence', 'user_id date start end'
+)
+
+
+def iter_presence(path):
+    """
+    Yields presence records of CSV file one by one, skipping broken lines.
+
+    This is the first stage of a streaming pipeline, which can be followed
+    by `filter_presence`, `group_by_user` and finished with
+    `aggregate_by_weekday` or `collect_presence`. Only the current record
+    is kept in memory, so it works with files of any size, e.g.:
+
+        aggregate_by_weekday(filter_presence(
+            iter_presence(path), first=datetime.date(2013, 1, 1)
+        ))
+
+    Yields:
+        Presence: user_id, datetime.date, start and end datetime.time.
+    """
+    with open(path, 'r') as csvfile:
+        for record in parse_rows(csvfile):
+            yield record
+
+
+def filter_presence(records, user_ids=None, first=None, last=None):
+    """
+    Yields presence records of given users in the date range.
+
+    Args:
+        records (iterable): `Presence` records.
+        user_ids (set): user ids, all users if None.
+        first (datetime.date): first day, unbounded if None.
+        last (datetime.date): last day, unbounded if None.
+    """
+    for record in records:
+        if user_ids is not None and record.user_id not in user_ids:
+            continue
+        if first is not None and record.date < first:
+            continue
+        if last is not None and record.date > last:
+            continue
+        yield record
+
+
+def group_by_user(records):
+    """
+    Yields (user_id, records) for every run of consecutive records of
+    the same user. The CSV file lists users one after another, so for it
+    every user is yielded once. Records of a run are not kept in memory.
+    """
+    return groupby(records, attrgetter('user_id'))
+
+
+def aggregate_by_weekday(records):
+    """
+    Sums presence records by user and weekday in a single pass.
+
+    Only the sums are kept in memory. Unlike `build_aggregates` it counts
+    every record, also repeated ones for the same day.
+
+    Returns:
+        dict: the same as `build_aggregates`.
+    """
+    result = {}
+    for record in records:
+        if record.user_id not in result:
+            result[record.user_id] = [[0, 0, 0, 0] for __ in range(7)]
+        start = seconds_since_midnight(record.start)
+        end = seconds_since_midnight(record.end)
+        weekday = result[record.user_id][record.date.weekday()]
+        weekday[0] += 1
+        weekday[1] += end - start
+        weekday[2] += start
+        weekday[3] += end
+    return result
+
+
+def collect_presence(records):
+    """
+    Collects presence records into the structure returned by
+    `storage.get_data`.
+    """
+    data = {}
+    for user_id, day, start, end in records:
+        data.setdefault(user_id, {})[day] = {'start': start, 'end': end}
+    return data
+
+
+def parse_rows(lines):
+    """
+    Yields presence records of CSV lines, skipping broken lines.
+
+    Yields:
+        Presence: user_id, datetime.date, start and end datetime.time.
+    """
+    if app.config['CSV_PARSER'] == 'fast':
+        parse_row = make_fast_row_parser()
+    else:
+        parse_row = parse_row_strict
+
+    presence_reader = csv.reader(lines, delimiter=',')
+    for i, row in enumerate(presence_reader):
+        if len(row) != 4:
+            # ignore header and footer lines
+            continue
+
+        try:
+            yield parse_row(row)
+        except (ValueError, TypeError):
+            log.debug('Problem with line %d: ', i, exc_info=True)
+
+
+def read_tail(path, offset):
+    """
+    Reads presence rows appended to CSV file after offset.
+
+    The last line is parsed even if it's not terminated yet, but the
+    returned offset points at its beginning, so it's read again next time.
+
+    Returns:
+        tuple: list of parsed rows and offset after the last complete line.
+    """
+    with open(path, 'rb') as csvfile:
+        csvfile.seek(offset)
+        chunk = csvfile.read()
+    rows = list(parse_rows(chunk.splitlines()))
+    return rows, offset + chunk.rfind('\n') + 1
+
+
+@metrics.instrumented
+def extend_data(data, derived, path, offset):
+    """
+    Adds presence rows appended to CSV file after offset.
+
+    Data is copied on write: users without new rows are shared with the old
+    data, which stays unchanged for threads still using it. Derived values
+    are updated if there's a function for it in `DERIVED_UPDATES`.
+
+    Returns:
+        tuple: new data, derived values and offset after the last
+            complete line.
+    """
+    rows, offset = read_tail(path, offset)
+    rows = [
+        (
+            user_id,
+            day.toordinal(),
+            seconds_since_midnight(start),
+            seconds_since_midnight(end),
+        )
+        for user_id, day, start, end in rows
+    ]
+    # day replaced by a row is either in the old data or an earlier row
+    latest = {}
+    changes = []
+    for user_id, day, start, end in rows:
+        old = latest.get((user_id, day))
+        if old is None and user_id in data:
+            old = find_entry(data[user_id], day)
+        latest[user_id, day] = (start, end)
+        changes.append((user_id, day, old, (start, end)))
+
+    if isinstance(data, ColumnStore):
+        data = data.extended(rows)
+    else:
+        data = dict(data)
+        copied = set()
+        for user_id, day, start, end in rows:
+            if user_id not in copied:
+                data[user_id] = dict(data.get(user_id, {}))
+                copied.add(user_id)
+            data[user_id][datetime.date.fromordinal(day)] = {
+                'start': seconds_to_time(start),
+                'end': seconds_to_time(end),
+            }
+
+    derived = {
+        function: DERIVED_UPDATES[function](value, changes)
+        for function, value in derived.iteritems()
+        if function in DERIVED_UPDATES
+    }
+    return data, derived, offset
+
+
+def find_entry(items, day):
+    """
+    Returns (start seconds, end seconds) of user's entry or None.
+
+    Args:
+        items (dict): data structure for user, see `utils.weekday_aggregates`,
+            or `UserColumns`.
+        day (int): day ordinal.
+    """
+    if isinstance(items, UserColumns):
+        return items.find(day)
+    entry = items.get(datetime.date.fromordinal(day))
+    if entry is None:
+        return None
+    return (
+        seconds_since_midnight(entry['start']),
+        seconds_since_midnight(entry['end']),
+    )
+
+
+def parse_row_strict(row):
+    """
+    Parses CSV row with strptime.
+
+    Args:
+        row (list): user_id, date, start and end strings.
+
+    Returns:
+        Presence: user_id, datetime.date, start and end datetime.time.
+    """
+    return Presence(
+        int(row[0]),
+        datetime.datetime.strptime(row[1], '%Y-%m-%d').date(),
+        datetime.datetime.strptime(row[2], '%H:%M:%S').time(),
+        datetime.datetime.strptime(row[3], '%H:%M:%S').time(),
+    )
+
+
+def make_fast_row_parser():
+    """
+    Creates CSV row parser for the fixed `YYYY-MM-DD,HH:MM:SS` layout.
+
+    Date and time strings are sliced instead of going through strptime
+    and every distinct string is parsed only once. Rows in any other
+    layout are passed to `parse_row_strict`.
+
+    Returns:
+        callable: function with the same interface as `parse_row_strict`.
+    """
+    dates = ParseCache(parse_fixed_date)
+    times = ParseCache(parse_fixed_time)
+    new_tuple = tuple.__new__
+
+    def parse_row(row):
+        """
+        Parses CSV row, see `parse_row_strict`.
+        """
+        try:
+            # skips Presence.__new__, which is a Python function call
+            return new_tuple(Presence, (
+                int(row[0]), dates[row[1]], times[row[2]], times[row[3]]
+            ))
+        except ValueError:
+            return parse_row_strict(row)
+
+    return parse_row
+
+
+class ParseCache(dict):
+    """
+    Dictionary which fills missing keys by parsing them.
+    """
+
+    def __init__(self, parse):
+        """
+        Args:
+            parse (callable): function which converts key to value.
+        """
+        super(ParseCache, self).__init__()
+        self.parse = parse
+
+    def __missing__(self, key):
+        value = self[key] = self.parse(key)
+        return value
+
+
+def parse_fixed_date(text):
+    """
+    Parses date in `YYYY-MM-DD` format.
+
+    Raises:
+        ValueError: if text is not in exactly this format.
+    """
+    if len(text) != 10 or text[4] != '-' or text[7] != '-':
+        raise ValueError('Not a fixed-width date: {0!r}'.format(text))
+    digits = text[:4] + text[5:7] + text[8:]
+    if not digits.isdigit():
+        raise ValueError('Not a fixed-width date: {0!r}'.format(text))
+    return datetime.date(int(digits[:4]), int(digits[4:6]), int(digits[6:]))
+
+
+def parse_fixed_time(text):
+    """
+    Parses time in `HH:MM:SS` format.
+
+    Raises:
+        ValueError: if text is not in exactly this format.
+    """
+    if len(text) != 8 or text[2] != ':' or text[5] != ':':
+        raise ValueError('Not a fixed-width time: {0!r}'.format(text))
+    digits = text[:2] + text[3:5] + text[6:]
+    if not digits.isdigit():
+        raise ValueError('Not a fixed-width time: {0!r}'.format(text))
+    return datetime.time(int(digits[:2]), int(digits[2:4]), int(digits[4:]))
+
+
+@metrics.instrumented
+def parse_xml_data(path):
+    """
+    Extracts data about users from XML.
+
+    It creates structure like this:
+    data = {
+        'user_id': {
+            'avatar': 'https://intranet.stxnext.pl/api/images/users/141',
+            'name': 'Adam P.',
+        },
+        'user_id': {
+            'avatar': 'https://intranet.stxnext.pl/api/images/users/176',
+            'name': 'Adrian K.',
+        },
+    }
+    """
+    data = {}
+    with open(path, 'r') as xmlfile:
+        xmldata_tree_object = etree.parse(xmlfile)
+        data_xml = xmldata_tree_object.getroot()
+
+        server_data = data_xml.find('server')
+        base_path = '{0}://{1}'.format(
+            server_data.find('protocol').text, server_data.find('host').text)
+        for user in data_xml.find('users'):
+            data[user.get('id')] = {
+                'avatar': '{0}{1}'.format(base_path, user.find('avatar').text),
+                'name': user.find('name').text,
+            }
+
+    return data
+
+
+def presence_rows(path):
+    """
+    Yields (user_id, day ordinal, start seconds, end seconds) of entries
+    in CSV file.
+    """
+    for record in iter_presence(path):
+        yield (
+            record.user_id,
+            record.date.toordinal(),
+            seconds_since_midnight(record.start),
+            seconds_since_midnight(record.end),
+        )
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling of a running application.
+
+With PROFILING enabled in config a request with the `_profile` query
+argument is run under cProfile: the stats are saved to PROFILE_DIR, and
+with `_profile=text` they are returned instead of the response.
+
+With SAMPLING_INTERVAL set a background thread samples stacks of all
+threads and periodically writes their counts to PROFILE_DIR in the folded
+format of flamegraph.pl.
+"""
+import os
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import threading
+from StringIO import StringIO
+from collections import Counter
+
+from flask import Response, g, request
+
+from presence_analyzer.main import app
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+@app.before_request
+def start_profiler():
+    """
+    Starts profiling the request if asked to.
+    """
+    if app.config['PROFILING'] and '_profile' in request.args:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def profile_text(response):
+    """
+    Returns stats of request profiled with `_profile=text` instead of
+    response.
+    """
+    profiler = g.get('profiler')
+    if profiler is None or request.args['_profile'] != 'text':
+        return response
+    profiler.disable()
+    output = StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats('cumulative').print_stats(50)
+    return Response(output.getvalue(), mimetype='text/plain')
+
+
+@app.teardown_request
+def stop_profiler(exception):  # pylint: disable=unused-argument
+    """
+    Stops profiling the request and saves its stats.
+
+    It's a teardown, not `after_request`, so the profiler is removed from
+    the thread also when the view raised an exception.
+    """
+    profiler = g.get('profiler')
+    if profiler is None:
+        return
+    profiler.disable()
+    g.profiler = None
+    path = os.path.join(
+        app.config['PROFILE_DIR'] or '.',
+        'profile-{0}-{1}-{2:.0f}.prof'.format(
+            request.endpoint, os.getpid(), time.time() * 1000
+        ),
+    )
+    profiler.dump_stats(path)
+    log.info('Saved profile of %s to %s', request.full_path, path)
+
+
+@app.before_first_request
+def start_sampler():
+    """
+    Starts sampling profiler if SAMPLING_INTERVAL is set.
+    """
+    interval = app.config['SAMPLING_INTERVAL']
+    if interval and sampler.thread is None:
+        path = os.path.join(
+            app.config['PROFILE_DIR'] or '.',
+            'samples-{0}.folded'.format(os.getpid()),
+        )
+        sampler.start(interval, path)
+
+
+class Sampler(object):
+    """
+    Counts stacks of all threads sampled in a background thread.
+    """
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self, interval, path, dump_interval=60):
+        """
+        Starts sampling every `interval` seconds and writing stacks to
+        `path` every `dump_interval` seconds.
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run, args=(interval, path, dump_interval)
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the last dump.
+        """
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def run(self, interval, path, dump_interval):
+        """
+        Samples stacks until stopped.
+        """
+        dumped_at = time.time()
+        while not self.stopped.wait(interval):
+            self.sample()
+            if time.time() - dumped_at >= dump_interval:
+                self.dump(path)
+                dumped_at = time.time()
+        self.dump(path)
+
+    def sample(self):
+        """
+        Counts current stacks of all other threads.
+        """
+        current = threading.current_thread().ident
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        for ident, frame in frames.iteritems():
+            if ident == current:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{0} ({1}:{2})'.format(
+                    code.co_name,
+                    os.path.basename(code.co_filename),
+                    code.co_firstlineno,
+                ))
+                frame = frame.f_back
+            with self.lock:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        """
+        Writes counts of all stacks sampled so far in folded format.
+        """
+        with self.lock:
+            lines = [
+                '{0} {1}\n'.format(stack, count)
+                for stack, count in sorted(self.stacks.iteritems())
+            ]
+        tmp_path = '{0}.tmp'.format(path)
+        with open(tmp_path, 'w') as output:
+            output.writelines(lines)
+        os.rename(tmp_path, path)
+
+
+sampler = Sampler()  # pylint: disable=invalid-name
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+JSON responses of the API: encoding, compression and caching.
+"""
+import hashlib
+import datetime
+import zlib
+from json import dumps
+from functools import wraps
+from collections import namedtuple
+
+from flask import Response, g, request
+from presence_analyzer.main import app
+from presence_analyzer import metrics
+from presence_analyzer.memo import MemoCache
+from presence_analyzer.storage import get_storage
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None  # pylint: disable=invalid-name
+
+
+def jsonify(function):
+    """
+    Creates a response with the JSON representation of wrapped function result.
+    """
+    @wraps(function)
+    def inner(*args, **kwargs):
+        """
+        This docstring will be overridden by @wraps decorator.
+        """
+        return Response(
+            serialize(function(*args, **kwargs)),
+            mimetype='application/json'
+        )
+    return inner
+
+
+@metrics.instrumented
+def serialize(result):
+    """
+    Returns compact JSON representation of view result.
+
+    With JSON_ENCODER set to 'ujson' and ujson installed it's used
+    instead of the standard library encoder.
+    """
+    if app.config['JSON_ENCODER'] == 'ujson' and ujson is not None:
+        return ujson.dumps(result)
+    return dumps(result, separators=(',', ':'))
+
+
+# view bodies rendered for an ETag
+CachedBody = namedtuple(  # pylint: disable=invalid-name
+    'CachedBody', 'data mimetype encoding'
+)
+
+
+response_cache = MemoCache(  # pylint: disable=invalid-name
+    lambda: (
+        app.config['RESPONSE_CACHE_SIZE'],
+        app.config['RESPONSE_CACHE_BYTES'],
+        app.config['RESPONSE_CACHE_TTL'],
+    )
+)
+
+
+def accepted_encoding():
+    """
+    Returns 'gzip' or 'deflate' if the client accepts it and compression
+    is enabled, None otherwise.
+    """
+    if app.config['COMPRESS_MIN_SIZE'] is None:
+        return None
+    for encoding in ('gzip', 'deflate'):
+        if request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+
+def compressor(encoding):
+    """
+    Returns zlib compressor of 'gzip' or 'deflate' content coding.
+    """
+    # 16 adds the gzip header and trailer, deflate coding is zlib format
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    return zlib.compressobj(6, zlib.DEFLATED, wbits)
+
+
+def compress(data, encoding):
+    """
+    Compresses response body with 'gzip' or 'deflate' content coding.
+    """
+    stream = compressor(encoding)
+    return stream.compress(data) + stream.flush()
+
+
+def stream_body(etag, sources, response, encoding, cache=True):
+    """
+    Yields chunks of streamed response compressed with `encoding`, and
+    stores the whole body in `response_cache` once it's complete.
+    """
+    stream = None if encoding is None else compressor(encoding)
+    parts = []
+    for chunk in response.iter_encoded():
+        if stream is not None:
+            chunk = stream.compress(chunk)
+        if chunk:
+            parts.append(chunk)
+            yield chunk
+    if stream is not None:
+        chunk = stream.flush()
+        parts.append(chunk)
+        yield chunk
+    if cache:
+        data = b''.join(parts)
+        body = CachedBody(data, response.mimetype, encoding)
+        response_cache.put(etag, body, len(data), sources)
+
+
+def render_body(etag, sources, encoding, function, *args, **kwargs):
+    """
+    Returns response of view function, with its body reused from
+    `response_cache` and compressed with `encoding` above
+    COMPRESS_MIN_SIZE.
+
+    Streamed responses, whose size is not known up front, are compressed
+    whenever the client accepts it, chunk by chunk, and cached when
+    complete. Non 200 responses are returned as they are.
+    """
+    profiled = g.get('profiler') is not None
+    body = None if profiled else response_cache.get(etag)
+    if body is None:
+        response = function(*args, **kwargs)
+        if response.status_code != 200:
+            return response
+        if response.is_streamed:
+            streamed = Response(
+                stream_body(
+                    etag, sources, response, encoding, cache=not profiled
+                ),
+                mimetype=response.mimetype,
+            )
+            if encoding:
+                streamed.headers['Content-Encoding'] = encoding
+            return streamed
+        data = response.get_data()
+        if encoding is None or len(data) < app.config['COMPRESS_MIN_SIZE']:
+            encoding = None
+        else:
+            data = compress(data, encoding)
+        body = CachedBody(data, response.mimetype, encoding)
+        response_cache.put(etag, body, len(data), sources)
+    response = Response(body.data, mimetype=body.mimetype)
+    if body.encoding:
+        response.headers['Content-Encoding'] = body.encoding
+    return response
+
+
+def conditional(*sources):
+    """
+    Adds ETag, Last-Modified and Cache-Control headers to the response
+    and answers conditional requests with 304 without calling the view.
+
+    ETag is derived from versions of the data sources, the request path
+    with its arguments and the accepted content coding. Bodies of responses
+    are cached by ETag, see `render_body`, and dropped from the cache when
+    versions of the sources change.
+
+    Args:
+        sources (str): config keys of the files the view reads,
+            see `storage.Storage.version`.
+    """
+    def decorator(function):
+        """
+        Wraps view function.
+        """
+        @wraps(function)
+        def inner(*args, **kwargs):
+            """
+            This docstring will be overridden by @wraps decorator.
+            """
+            backend = get_storage()
+            versions = [backend.version(source) for source in sources]
+            response_cache.invalidate(sources, versions)
+            encoding = accepted_encoding()
+            etag = hashlib.md5(
+                repr((versions, request.full_path, encoding))
+            ).hexdigest()
+            last_modified = datetime.datetime.utcfromtimestamp(
+                int(max(version[4] for version in versions))  # mtime
+            )
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and \
+                    request.if_modified_since >= last_modified
+
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = render_body(
+                    etag, sources, encoding, function, *args, **kwargs
+                )
+            response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            response.last_modified = last_modified
+            response.cache_control.public = True
+            response.cache_control.max_age = app.config['API_MAX_AGE']
+            return response
+        return inner
+    return decorator
@@ -26,10 +26,14 @@ del _buildout_path
 
 
 # bin/paster serve parts/etc/deploy.ini
-def make_app(global_conf={}, config=DEPLOY_CFG, debug=False):
+def make_app(global_conf={}, config=DEPLOY_CFG, debug=False, warm_up=True):
     from presence_analyzer import app
+    from presence_analyzer.background import background
     app.config.from_pyfile(abspath(config))
     app.debug = debug
+    if warm_up:
+        # WARM_UP and REFRESH_INTERVAL from config
+        background.start()
     return app
 
 
@@ -50,6 +54,20 @@ def make_shell():
     return locals()
 
 
+def _serve_gevent(action, debug=False, dry_run=False):
+    """Serve the app with gevent in the foreground."""
+    if action not in ('', 'fg', 'foreground'):
+        print 'gevent server runs in the foreground only, use fg'
+        return
+    from presence_analyzer import serving
+    app = make_app(config=DEBUG_CFG if debug else DEPLOY_CFG, debug=debug)
+    host, port = app.config['SERVE_HOST'], app.config['SERVE_PORT']
+    print 'gevent serving on %s:%d' % (host, port)
+    if dry_run:
+        return
+    serving.serve(app, host, port, app.config['SERVE_THREADS'])
+
+
 def _serve(action, debug=False, dry_run=False):
     """Build paster command from 'action' and 'debug' flag."""
     if debug:
@@ -82,8 +100,9 @@ def _serve(action, debug=False, dry_run=False):
 def run():
     action_shell = werkzeug.script.make_shell(make_shell, make_shell.__doc__)
 
-    # bin/flask-ctl serve [fg|start|stop|restart|status]
-    def action_serve(action=('a', 'start'), dry_run=False):
+    # bin/flask-ctl serve [fg|start|stop|restart|status] [--server=gevent]
+    def action_serve(action=('a', 'start'), dry_run=False,
+                     server=('s', 'paste')):
         """Serve the application.
 
         This command serves a web application that uses a paste.deploy
@@ -92,8 +111,12 @@ def run():
         Options:
          - 'action' is one of [fg|start|stop|restart|status]
          - '--dry-run' print the paster command and exit
+         - '--server' 'paste' or 'gevent' (fg only, SERVE_* from config)
         """
-        _serve(action, debug=False, dry_run=dry_run)
+        if server == 'gevent':
+            _serve_gevent(action, debug=False, dry_run=dry_run)
+        else:
+            _serve(action, debug=False, dry_run=dry_run)
 
     # bin/flask-ctl debug [fg|start|stop|restart|status]
     def action_debug(action=('a', 'start'), dry_run=False):
@@ -110,4 +133,81 @@ def run():
         """Stop the application."""
         _serve('stop', dry_run=dry_run)
 
+    # bin/flask-ctl snapshot [--output=path]
+    def action_snapshot(output=('o', '')):
+        """Compile DATA_CSV into a binary snapshot.
+
+        Options:
+         - '--output' snapshot path, DATA_SNAPSHOT from config by default
+        """
+        from presence_analyzer import parsing, snapshot
+        app = make_app(warm_up=False)
+        path = output or app.config['DATA_SNAPSHOT']
+        if not path:
+            print 'Set DATA_SNAPSHOT in config or pass --output'
+            return
+        store = snapshot.compile_csv(
+            app.config['DATA_CSV'], path, parsing.parse_columns
+        )
+        print 'Wrote %d users to %s' % (len(store), path)
+
+    # bin/flask-ctl import [--output=path]
+    def action_import(output=('o', '')):
+        """Import DATA_CSV and DATA_XML into SQLite database.
+
+        Options:
+         - '--output' database path, DATA_DB from config by default
+        """
+        from presence_analyzer import storage
+        app = make_app(warm_up=False)
+        path = output or app.config['DATA_DB']
+        if not path:
+            print 'Set DATA_DB in config or pass --output'
+            return
+        count = storage.import_sqlite(path)
+        print 'Imported %d entries to %s' % (count, path)
+
+    # bin/flask-ctl dataplane [--once] [--interval=seconds]
+    def action_dataplane(once=False, interval=('i', 5)):
+        """Publish DATA_CSV and DATA_XML to DATA_PLANE for workers.
+
+        Runs until interrupted, publishing a new generation whenever
+        one of the files changes. Workers read it with STORAGE 'shared'.
+        Files which cannot be read (e.g. half-written by cron) are logged
+        and tried again, workers keep the last published generation.
+
+        Options:
+         - '--once' publish current data and exit
+         - '--interval' seconds between checks for changes
+        """
+        import time
+        import logging
+        from presence_analyzer import filecache, storage
+        logging.basicConfig()
+        log = logging.getLogger(__name__)
+        app = make_app(warm_up=False)
+        directory = app.config['DATA_PLANE']
+        if not directory:
+            print 'Set DATA_PLANE in config'
+            return
+        published = None
+        while True:
+            signatures = (
+                filecache.file_signature(app.config['DATA_CSV']),
+                filecache.file_signature(app.config['DATA_XML']),
+            )
+            if signatures != published:
+                try:
+                    name = storage.publish_data_plane(directory)
+                except storage.users_cache.errors + (IOError, OSError):
+                    if once:
+                        raise
+                    log.warning('Cannot publish, retrying', exc_info=True)
+                else:
+                    published = signatures
+                    print 'Published %s' % name
+            if once:
+                return
+            time.sleep(interval)
+
     werkzeug.script.run()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Serving the app with gevent.
+
+`flask-ctl serve fg --server=gevent` runs the app in gevent's WSGIServer
+instead of Paste's thread pool. Every connection is a greenlet, so
+thousands of idle dashboard connections take little memory, but a
+greenlet blocking on I/O stops all of them. The standard library is not
+monkey-patched, so background threads stay real threads, and:
+
+- with 'files' storage loaded and kept fresh by a background thread
+  (WARM_UP 'eager' with WATCH_FILES or REFRESH_INTERVAL) requests don't
+  touch the disk and are handled in their greenlets,
+- otherwise requests, which may load data or query SQLite, are run in
+  the hub's pool of SERVE_THREADS threads while the greenlet waits.
+"""
+import socket
+
+from presence_analyzer.main import app
+from presence_analyzer import storage
+
+try:
+    from gevent import get_hub
+    from gevent.pywsgi import WSGIHandler, WSGIServer
+except ImportError:  # pragma: no cover
+    WSGIHandler = WSGIServer = None  # pylint: disable=invalid-name
+
+
+def data_in_memory():
+    """
+    Tells whether requests can be handled without reading files.
+    """
+    if app.config['STORAGE'] != 'files':
+        return False
+    return all(
+        cache.watched and cache.entry.signature is not None and
+        cache.entry.signature[0] == app.config[source]
+        for source, cache in storage.SOURCES.iteritems()
+    )
+
+
+class Offloading(object):
+    """
+    WSGI middleware running requests which may block in a thread pool.
+    """
+
+    def __init__(self, application, pool):
+        """
+        Args:
+            application (callable): WSGI application.
+            pool: pool with `apply(function, args)` waiting for result.
+        """
+        self.application = application
+        self.pool = pool
+
+    def __call__(self, environ, start_response):
+        if data_in_memory():
+            return self.application(environ, start_response)
+        return self.pool.apply(self.respond, (environ, start_response))
+
+    def respond(self, environ, start_response):
+        """
+        Calls the application and reads its body, so streamed responses
+        (like batch queries of SQLite) are generated in the pool too,
+        not in the hub when the server sends them.
+        """
+        body = self.application(environ, start_response)
+        try:
+            return list(body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+if WSGIHandler is not None:
+    class NoDelayHandler(WSGIHandler):
+        """
+        Handler of connection with Nagle's algorithm disabled.
+
+        pywsgi sends headers and body in separate writes, so on kept alive
+        connections the body would wait for the client's delayed ACK.
+        """
+
+        def handle(self):
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return super(NoDelayHandler, self).handle()
+
+
+def make_server(application, host, port, threads=10):
+    """
+    Returns gevent WSGIServer of the application, not started yet.
+
+    Raises:
+        RuntimeError: if gevent is not installed.
+    """
+    if WSGIServer is None:
+        raise RuntimeError('gevent is not installed')
+    pool = get_hub().threadpool
+    pool.maxsize = threads
+    return WSGIServer(
+        (host, port), Offloading(application, pool),
+        handler_class=NoDelayHandler, log=None,
+    )
+
+
+def serve(application, host, port, threads=10):
+    """
+    Serves the application until interrupted.
+    """
+    make_server(application, host, port, threads).serve_forever()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Binary snapshot of parsed presence data.
+
+Snapshot layout (little-endian):
+    header: magic, source CSV size and mtime, number of users and rows
+    index:  (user_id, first row, number of rows) for every user
+    data:   int32 columns of day ordinals, start and end seconds of all
+            rows, grouped by user and sorted by day.
+
+The columns are memory-mapped, so loading is nearly instant and the
+pages are shared by all processes via the OS page cache: as NumPy arrays
+with NumPy installed, as `MappedColumn` views without it. `read` copies
+them to arrays unless asked to share them.
+"""
+import os
+import sys
+import mmap
+import struct
+import logging
+from array import array
+from collections import Sequence
+
+from presence_analyzer.columns import ColumnStore, UserColumns
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pylint: disable=invalid-name
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+MAGIC = 'PASNAP01'
+HEADER = struct.Struct('<8sQdII')
+INDEX = struct.Struct('<iII')
+INT = struct.Struct('<i')
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot file is not valid.
+    """
+
+
+def write(path, store, source_size, source_mtime):
+    """
+    Writes store to snapshot file.
+
+    The file is written under a temporary name and renamed, so readers
+    never see a partially written snapshot.
+
+    Args:
+        path (str): snapshot file path.
+        store (ColumnStore): presence data.
+        source_size (int): size of the CSV file the data comes from.
+        source_mtime (float): modification time of the CSV file.
+    """
+    user_ids = sorted(store)
+    columns = ([], [], [])
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as snapshot:
+        rows = sum(len(store[user_id]) for user_id in user_ids)
+        snapshot.write(HEADER.pack(
+            MAGIC, source_size, source_mtime, len(user_ids), rows
+        ))
+        offset = 0
+        for user_id in user_ids:
+            user_columns = store[user_id]
+            snapshot.write(INDEX.pack(user_id, offset, len(user_columns)))
+            offset += len(user_columns)
+            columns[0].append(user_columns.days)
+            columns[1].append(user_columns.starts)
+            columns[2].append(user_columns.ends)
+        for column in columns:
+            for part in column:
+                if not isinstance(part, array):
+                    part = array('i', part.tolist())
+                if sys.byteorder == 'big':
+                    part = array('i', part)
+                    part.byteswap()
+                part.tofile(snapshot)
+    os.rename(tmp_path, path)
+
+
+class MappedColumn(Sequence):
+    """
+    Read-only int32 column in a memory-mapped snapshot, used instead of
+    a NumPy array when NumPy is not installed.
+    """
+    __slots__ = ('mapped', 'offset', 'count')
+
+    def __init__(self, mapped, offset, count):
+        self.mapped = mapped
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.count)
+            if step != 1:
+                return self.tolist()[i]
+            return MappedColumn(
+                self.mapped, self.offset + 4 * start, max(0, stop - start)
+            )
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return INT.unpack_from(self.mapped, self.offset + 4 * i)[0]
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        """
+        Returns column copied to a list.
+        """
+        data = array('i', self.mapped[
+            self.offset:self.offset + 4 * self.count
+        ])
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return data.tolist()
+
+
+def read(path, share=False):
+    """
+    Reads snapshot file.
+
+    Args:
+        path (str): snapshot file path.
+        share (bool): keep columns in the mapped file even without NumPy,
+            see `MappedColumn`.
+
+    Returns:
+        tuple: source CSV size, source CSV mtime and `ColumnStore`.
+
+    Raises:
+        SnapshotError: if the file is not a valid snapshot.
+    """
+    with open(path, 'rb') as snapshot:
+        mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, source_size, source_mtime, users, rows = HEADER.unpack_from(
+            mapped
+        )
+    except struct.error:
+        raise SnapshotError('Snapshot {0} is truncated'.format(path))
+    data_offset = HEADER.size + INDEX.size * users
+    if magic != MAGIC or len(mapped) != data_offset + 3 * 4 * rows:
+        raise SnapshotError('Snapshot {0} is not valid'.format(path))
+
+    def column(number, first, count):
+        """
+        Returns one column of rows as int32 array.
+        """
+        start = data_offset + 4 * (number * rows + first)
+        if numpy is not None:
+            return numpy.frombuffer(
+                mapped, dtype='<i4', count=count, offset=start
+            )
+        if share:
+            return MappedColumn(mapped, start, count)
+        data = array('i', mapped[start:start + 4 * count])
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return data
+
+    store = {}
+    for i in range(users):
+        user_id, first, count = INDEX.unpack_from(
+            mapped, HEADER.size + INDEX.size * i
+        )
+        store[user_id] = UserColumns(
+            column(0, first, count),
+            column(1, first, count),
+            column(2, first, count),
+        )
+    if numpy is None and not share:
+        mapped.close()
+    return source_size, source_mtime, ColumnStore(store)
+
+
+def load(path, source_path):
+    """
+    Reads snapshot file if it was compiled from the current source CSV,
+    keeping its columns in the mapped file.
+
+    Returns:
+        ColumnStore: presence data or None if the snapshot is missing,
+            broken or out of date.
+    """
+    try:
+        source_size, source_mtime, store = read(path, share=True)
+        stat = os.stat(source_path)
+    except (IOError, OSError, SnapshotError, ValueError):
+        log.warning('Cannot read snapshot %s', path, exc_info=True)
+        return None
+    if (source_size, source_mtime) != (stat.st_size, stat.st_mtime):
+        log.info('Snapshot %s is out of date', path)
+        return None
+    return store
+
+
+def compile_csv(source_path, path, parse):
+    """
+    Parses CSV file and writes its snapshot.
+
+    Args:
+        source_path (str): CSV file path.
+        path (str): snapshot file path.
+        parse (callable): function returning `ColumnStore` for CSV path.
+
+    Returns:
+        ColumnStore: parsed presence data.
+    """
+    stat = os.stat(source_path)
+    store = parse(source_path)
+    write(path, store, stat.st_size, stat.st_mtime)
+    return store
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized presence statistics computed with NumPy.
+
+Every function works on `ColumnStore` columns of any number of users at
+once and returns the same results as its pure Python counterpart in
+`presence_analyzer.utils`.
+"""
+from array import array
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pylint: disable=invalid-name
+
+
+def available():
+    """
+    Tells whether NumPy is installed.
+    """
+    return numpy is not None
+
+
+def as_numpy(column):
+    """
+    Returns NumPy view of integer column without copying when possible.
+    """
+    if isinstance(column, array) and column:
+        return numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+    return numpy.asarray(column)
+
+
+def grouped_columns(store):
+    """
+    Concatenates columns of all users in the store.
+
+    Returns:
+        tuple: list of user ids and arrays of group codes
+            (user index * 7 + weekday), start seconds and end seconds.
+    """
+    user_ids = list(store)
+    columns = [store[user_id] for user_id in user_ids]
+    lengths = [len(user_columns) for user_columns in columns]
+    if not user_ids or not sum(lengths):
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return user_ids, empty, empty, empty
+
+    def concatenate(name):
+        """
+        Concatenates one column of all users.
+        """
+        return numpy.concatenate([
+            as_numpy(getattr(user_columns, name)) for user_columns in columns
+        ]).astype(numpy.int64)
+
+    days = concatenate('days')
+    users = numpy.repeat(numpy.arange(len(user_ids)), lengths)
+    codes = users * 7 + (days - 1) % 7
+    return user_ids, codes, concatenate('starts'), concatenate('ends')
+
+
+def aggregates(store):
+    """
+    Sums presence data of every user by weekday.
+
+    Returns:
+        dict: the same as `utils.build_aggregates`.
+    """
+    user_ids, codes, starts, ends = grouped_columns(store)
+    size = len(user_ids) * 7
+
+    def grouped_sum(weights=None):
+        """
+        Sums weights in every (user, weekday) group.
+        """
+        result = numpy.bincount(codes, weights=weights, minlength=size)
+        return result.astype(numpy.int64).reshape(len(user_ids), 7).tolist()
+
+    counts = grouped_sum()
+    totals = grouped_sum(ends - starts)
+    start_sums = grouped_sum(starts)
+    end_sums = grouped_sum(ends)
+    return {
+        user_id: [
+            list(weekday) for weekday in zip(
+                counts[i], totals[i], start_sums[i], end_sums[i]
+            )
+        ]
+        for i, user_id in enumerate(user_ids)
+    }
+
+
+def summary(store, percentiles=(25, 50, 75, 90)):
+    """
+    Computes statistics of presence intervals of every user by weekday.
+
+    Returns:
+        dict: the same as `utils.build_summary`.
+    """
+    user_ids, codes, starts, ends = grouped_columns(store)
+    size = len(user_ids) * 7
+    intervals = ends - starts
+    counts = numpy.bincount(codes, minlength=size)
+    totals = numpy.bincount(codes, weights=intervals, minlength=size)
+    totals = totals.astype(numpy.int64)
+    if len(intervals):
+        # sorted by group, then by interval, so every group is a sorted
+        # slice; a single combined key sorts much faster than lexsort
+        lowest = intervals.min()
+        span = intervals.max() - lowest + 1
+        keys = numpy.sort(codes * span + (intervals - lowest))
+        intervals = keys % span + lowest
+    intervals = intervals.astype(numpy.float64)
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+
+    def grouped_percentile(percent):
+        """
+        Interpolates percentile in every group of sorted intervals.
+        """
+        if not len(intervals):
+            return numpy.zeros(size)
+        position = (numpy.maximum(counts, 1) - 1) * (percent / 100.0)
+        lower = numpy.floor(position).astype(numpy.int64)
+        upper = numpy.minimum(lower + 1, numpy.maximum(counts, 1) - 1)
+        last = len(intervals) - 1
+        low = intervals[numpy.minimum(offsets + lower, last)]
+        high = intervals[numpy.minimum(offsets + upper, last)]
+        return numpy.where(
+            counts > 0, low + (high - low) * (position - lower), 0
+        )
+
+    values = {
+        percent: grouped_percentile(percent).tolist()
+        for percent in set(percentiles) | {50}
+    }
+    counts = counts.tolist()
+    totals = totals.tolist()
+    result = {}
+    for i, user_id in enumerate(user_ids):
+        weekdays = []
+        for code in range(i * 7, i * 7 + 7):
+            count = counts[code]
+            weekdays.append({
+                'count': count,
+                'total': totals[code],
+                'mean': float(totals[code]) / count if count else 0,
+                'median': values[50][code] if count else 0,
+                'percentiles': {
+                    percent: values[percent][code] if count else 0
+                    for percent in percentiles
+                },
+            })
+        result[user_id] = weekdays
+    return result
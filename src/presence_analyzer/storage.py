@@ -0,0 +1,578 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends of presence data and users.
+
+Views read data through a `Storage` selected by the STORAGE config key,
+see `get_storage`:
+
+- 'files' keeps CSV and XML files parsed in memory (`FileStorage`),
+- 'sqlite' queries a database built by `flask-ctl import`, indexed on
+  (user_id, day), so a single user's entries are read without scanning,
+  or holding, the whole data set (`SQLiteStorage`),
+- 'shared' attaches data published by `flask-ctl dataplane`
+  (`SharedStorage`).
+"""
+import os
+import sqlite3
+import threading
+
+from lxml import etree
+from presence_analyzer.main import app
+from presence_analyzer.columns import Timeline
+from presence_analyzer import dataplane, metrics
+from presence_analyzer.dataplane import DataPlane
+from presence_analyzer.filecache import FileCache
+from presence_analyzer.parsing import (
+    can_fork,
+    extend_data,
+    load_data,
+    parse_columns,
+    parse_parallel,
+    parse_xml_data,
+    presence_rows,
+)
+from presence_analyzer.utils import (
+    build_aggregates,
+    build_date_index,
+    build_timelines,
+    weekday_aggregates,
+)
+
+# day ordinal 1 is a Monday, like in `utils.ordinal_weekday`
+WEEKDAY_SUMS = """
+    (day - 1) % 7 AS weekday,
+    COUNT(*),
+    SUM(end_time - start_time),
+    SUM(start_time),
+    SUM(end_time)
+"""
+# materialized on import, aggregates over all days are read from it
+REFRESH_WEEKDAY_TOTALS = """
+INSERT INTO weekday_totals
+SELECT user_id, {0} FROM presence GROUP BY user_id, weekday
+""".format(WEEKDAY_SUMS)
+
+SCHEMA = """
+CREATE TABLE presence (
+    user_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day)
+) WITHOUT ROWID;
+CREATE TABLE weekday_totals (
+    user_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    entries INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    start_sum INTEGER NOT NULL,
+    end_sum INTEGER NOT NULL,
+    PRIMARY KEY (user_id, weekday)
+) WITHOUT ROWID;
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    avatar TEXT NOT NULL
+);
+"""
+
+
+class Storage(object):
+    """
+    Interface of storage backends.
+
+    Days are passed as `datetime.date`, presence is returned in the
+    structures of `presence_analyzer.utils`.
+    """
+
+    def version(self, source):
+        """
+        Returns version of data source (config key, like 'DATA_CSV'),
+        a tuple ending with modification time.
+        """
+        raise NotImplementedError
+
+    def user_ids(self):
+        """
+        Returns sorted ids of users with presence entries.
+        """
+        raise NotImplementedError
+
+    def user_aggregates(self, user_id, first=None, last=None):
+        """
+        Returns presence of a single user in date range summed by weekday,
+        see `utils.weekday_aggregates`, or None for unknown user.
+        """
+        raise NotImplementedError
+
+    def aggregates_lookup(self, first=None, last=None):
+        """
+        Returns function which takes user_id and returns result of
+        `user_aggregates` for the date range.
+        """
+        return lambda user_id: self.user_aggregates(user_id, first, last)
+
+    def timeline(self, user_id):
+        """
+        Returns `Timeline` of a single user or None for unknown user.
+        """
+        raise NotImplementedError
+
+    def users(self):
+        """
+        Returns data about users, see `parsing.parse_xml_data`.
+        """
+        raise NotImplementedError
+
+    def warm_up(self):
+        """
+        Loads data changed since the last call and precomputes values
+        derived from it, so requests don't have to.
+        """
+        self.user_ids()
+        self.users()
+
+
+class SQLiteStorage(Storage):
+    """
+    Presence data and users in SQLite database.
+
+    Weekday aggregates are computed by SQLite: read from `weekday_totals`
+    for all days, summed with GROUP BY over the (user_id, day) index for
+    date ranges.
+
+    Every thread gets its own connection, which is reopened when the
+    database file is replaced by a new import.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): database file path.
+        """
+        self.path = path
+        self.local = threading.local()
+
+    def version(self, source=None):
+        """
+        Returns (path, device, inode, size, mtime) of the database file,
+        which holds all data sources.
+        """
+        stat = os.stat(self.path)
+        return self.path, stat.st_dev, stat.st_ino, stat.st_size, \
+            stat.st_mtime
+
+    def connection(self):
+        """
+        Returns connection of the current thread.
+        """
+        inode = self.version()[1:3]  # raises OSError if file is missing
+        if getattr(self.local, 'inode', None) != inode:
+            if getattr(self.local, 'connection', None) is not None:
+                self.local.connection.close()
+            self.local.connection = sqlite3.connect(self.path)
+            self.local.inode = inode
+        return self.local.connection
+
+    def user_ids(self):
+        return [
+            user_id for user_id, in self.connection().execute(
+                'SELECT DISTINCT user_id FROM weekday_totals ORDER BY user_id'
+            )
+        ]
+
+    def user_rows(self, user_id, first=None, last=None):
+        """
+        Returns (day ordinal, start seconds, end seconds) of user's entries
+        between two days, sorted by day.
+        """
+        return self.connection().execute(
+            'SELECT day, start_time, end_time FROM presence '
+            'WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day',
+            (user_id,) + day_range(first, last)
+        ).fetchall()
+
+    def has_user(self, user_id):
+        """
+        Tells whether user has any presence entries.
+        """
+        return self.connection().execute(
+            'SELECT 1 FROM weekday_totals WHERE user_id = ? LIMIT 1',
+            (user_id,)
+        ).fetchone() is not None
+
+    def user_aggregates(self, user_id, first=None, last=None):
+        if first is None and last is None:
+            rows = self.connection().execute(
+                'SELECT weekday, entries, total, start_sum, end_sum '
+                'FROM weekday_totals WHERE user_id = ?', (user_id,)
+            ).fetchall()
+            return weekday_lists(rows) if rows else None
+        rows = self.connection().execute(
+            'SELECT {0} FROM presence '
+            'WHERE user_id = ? AND day BETWEEN ? AND ? '
+            'GROUP BY weekday'.format(WEEKDAY_SUMS),
+            (user_id,) + day_range(first, last)
+        ).fetchall()
+        if not rows and not self.has_user(user_id):
+            return None
+        return weekday_lists(rows)
+
+    def aggregates_lookup(self, first=None, last=None):
+        if first is not None or last is not None:
+            return super(SQLiteStorage, self).aggregates_lookup(first, last)
+        # all users at once, a single scan of the small summary table
+        grouped = {}
+        for row in self.connection().execute(
+                'SELECT user_id, weekday, entries, total, start_sum, end_sum '
+                'FROM weekday_totals'):
+            grouped.setdefault(row[0], []).append(row[1:])
+        aggregates = {
+            user_id: weekday_lists(rows)
+            for user_id, rows in grouped.iteritems()
+        }
+        return aggregates.get
+
+    def timeline(self, user_id):
+        rows = self.user_rows(user_id)
+        if not rows:
+            return None
+        return Timeline(rows)
+
+    def users(self):
+        return {
+            str(user_id): {'avatar': avatar, 'name': name}
+            for user_id, name, avatar in self.connection().execute(
+                'SELECT user_id, name, avatar FROM users'
+            )
+        }
+
+
+def day_range(first, last):
+    """
+    Returns ordinals of the first and the last day, unbounded for None.
+    """
+    return (
+        first.toordinal() if first else 0,
+        last.toordinal() if last else 2 ** 31 - 1,
+    )
+
+
+def weekday_lists(rows):
+    """
+    Converts (weekday, count, total, start sum, end sum) rows to the list
+    returned by `utils.weekday_aggregates`.
+    """
+    result = [[0, 0, 0, 0] for __ in range(7)]
+    for row in rows:
+        result[row[0]] = list(row[1:])
+    return result
+
+
+def import_data(path, rows, users):
+    """
+    Writes presence data and users to a new SQLite database.
+
+    The database is written under a temporary name, synced to disk and
+    renamed, so neither readers nor a crash leave a partially imported one.
+
+    Args:
+        path (str): database file path.
+        rows (iterable): (user_id, day ordinal, start seconds, end seconds)
+            tuples, for repeated days the last one wins.
+        users (dict): data about users, see `parsing.parse_xml_data`.
+
+    Returns:
+        int: number of imported presence entries.
+    """
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        # nobody reads the temporary file until it's synced and renamed
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.executescript(SCHEMA)
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO presence VALUES (?, ?, ?, ?)', rows
+            )
+            connection.executemany(
+                'INSERT INTO users VALUES (?, ?, ?)',
+                (
+                    (int(user_id), user['name'], user['avatar'])
+                    for user_id, user in users.iteritems()
+                )
+            )
+            connection.execute(REFRESH_WEEKDAY_TOTALS)
+        count, = connection.execute('SELECT COUNT(*) FROM presence').fetchone()
+    finally:
+        connection.close()
+    with open(tmp_path, 'rb') as database:
+        os.fsync(database.fileno())
+    os.rename(tmp_path, path)
+    return count
+
+
+@metrics.instrumented
+def get_data():
+    """
+    Returns presence data grouped by user_id.
+
+    Data is parsed from the CSV file on the first call and kept in memory
+    until the file changes, see `parsing.parse_data` for the structure.
+    The result is shared between threads and must not be modified.
+    """
+    return presence_cache.get(app.config['DATA_CSV'])
+
+
+presence_cache = FileCache(  # pylint: disable=invalid-name
+    load_data,
+    extend=extend_data,
+)
+
+
+def get_aggregates():
+    """
+    Returns presence data of all users summed by weekday.
+
+    Aggregates are computed once for every version of the CSV file,
+    see `build_aggregates` for the structure.
+    """
+    return presence_cache.derive(app.config['DATA_CSV'], build_aggregates)
+
+
+@metrics.instrumented
+def get_user_aggregates(user_id, first=None, last=None):
+    """
+    Returns presence data of a single user summed by weekday.
+
+    Args:
+        user_id (int): user id.
+        first (datetime.date): first day of date range, unbounded if None.
+        last (datetime.date): last day of date range, unbounded if None.
+
+    Returns:
+        list: see `utils.weekday_aggregates`, or None for unknown user.
+    """
+    return aggregates_lookup(first, last)(user_id)
+
+
+@metrics.instrumented
+def aggregates_lookup(first=None, last=None):
+    """
+    Returns function which takes user_id and returns result of
+    `get_user_aggregates` for the date range.
+
+    Data is fetched once, so all lookups see the same version of it.
+    """
+    if first is None and last is None:
+        return get_aggregates().get
+    index = presence_cache.derive(app.config['DATA_CSV'], build_date_index)
+    first = first and first.toordinal()
+    last = last and last.toordinal()
+
+    def lookup(user_id):
+        """
+        Sums user's entries in the date range by weekday.
+        """
+        user_index = index.get(user_id)
+        if user_index is None:
+            return None
+        return user_index.aggregates(first, last)
+
+    return lookup
+
+
+def get_timeline(user_id):
+    """
+    Returns `Timeline` of a single user or None for unknown user.
+    """
+    return presence_cache.derive(
+        app.config['DATA_CSV'], build_timelines
+    ).get(user_id)
+
+
+@metrics.instrumented
+def get_xml_data():
+    """
+    Returns data about users.
+
+    Data is parsed from the XML file on the first call and kept in memory.
+    When the file is replaced it's parsed again in the background, while
+    callers keep getting the previous data, see `parse_xml_data` for
+    the structure. The result is shared between threads and must not be
+    modified.
+    """
+    return users_cache.get(app.config['DATA_XML'])
+
+
+users_cache = FileCache(  # pylint: disable=invalid-name
+    parse_xml_data,
+    background=True,
+    errors=(etree.XMLSyntaxError, AttributeError),
+)
+
+
+# config keys of data files mapped to their caches
+SOURCES = {
+    'DATA_CSV': presence_cache,
+    'DATA_XML': users_cache,
+}
+
+
+# values derived from presence data which requests use
+PRESENCE_INDEXES = (build_aggregates, build_date_index, build_timelines)
+
+
+class FileStorage(Storage):
+    """
+    Presence data from DATA_CSV and users from DATA_XML, parsed and kept
+    in memory by `presence_cache` and `users_cache`.
+    """
+
+    def version(self, source):
+        return SOURCES[source].version(app.config[source])
+
+    def user_ids(self):
+        return sorted(get_aggregates())
+
+    def user_aggregates(self, user_id, first=None, last=None):
+        return get_user_aggregates(user_id, first, last)
+
+    def aggregates_lookup(self, first=None, last=None):
+        return aggregates_lookup(first, last)
+
+    def timeline(self, user_id):
+        return get_timeline(user_id)
+
+    def users(self):
+        return get_xml_data()
+
+    def warm_up(self):
+        for source in SOURCES:
+            self.refresh(source)
+        for function in PRESENCE_INDEXES:
+            presence_cache.derive(app.config['DATA_CSV'], function)
+
+    @staticmethod
+    def refresh(source):
+        """
+        Reloads data source (config key) if it has changed. Indexes of
+        presence data are rebuilt before the new data is served.
+        """
+        prepare = PRESENCE_INDEXES if source == 'DATA_CSV' else ()
+        SOURCES[source].refresh(app.config[source], prepare)
+
+
+class SharedStorage(Storage):
+    """
+    Presence data and users of the generation published to DATA_PLANE,
+    shared by all processes, see `presence_analyzer.dataplane`.
+
+    Only the small per-user aggregates are computed in every process,
+    date ranges and timelines are read from the shared columns.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): data plane directory.
+        """
+        self.plane = DataPlane(directory)
+
+    def version(self, source):
+        return self.plane.get().version
+
+    def user_ids(self):
+        return sorted(self.plane.get().store)
+
+    def user_aggregates(self, user_id, first=None, last=None):
+        return self.aggregates_lookup(first, last)(user_id)
+
+    def aggregates_lookup(self, first=None, last=None):
+        generation = self.plane.get()
+        if first is None and last is None:
+            return generation.derive(build_aggregates).get
+        first = first and first.toordinal()
+        last = last and last.toordinal()
+
+        def lookup(user_id):
+            """
+            Sums user's entries in the date range by weekday.
+            """
+            items = generation.store.get(user_id)
+            if items is None:
+                return None
+            return weekday_aggregates(items.between(first, last))
+
+        return lookup
+
+    def timeline(self, user_id):
+        items = self.plane.get().store.get(user_id)
+        if items is None:
+            return None
+        return Timeline(items.rows())
+
+    def users(self):
+        return self.plane.get().users
+
+    def warm_up(self):
+        self.plane.get().derive(build_aggregates)
+
+
+file_storage = FileStorage()  # pylint: disable=invalid-name
+
+
+# (STORAGE, path) mapped to storage using that path
+storages = {}  # pylint: disable=invalid-name
+
+
+def get_storage():
+    """
+    Returns `Storage` selected by STORAGE config key.
+    """
+    kind = app.config['STORAGE']
+    if kind == 'sqlite':
+        key, factory = (kind, app.config['DATA_DB']), SQLiteStorage
+    elif kind == 'shared':
+        key, factory = (kind, app.config['DATA_PLANE']), SharedStorage
+    else:
+        return file_storage
+    if key not in storages:
+        storages[key] = factory(key[1])
+    return storages[key]
+
+
+def publish_data_plane(directory):
+    """
+    Publishes DATA_CSV and DATA_XML as new generation of shared data.
+
+    Returns:
+        str: name of the generation.
+    """
+    path = app.config['DATA_CSV']
+    stat = os.stat(path)
+    if app.config['DATA_CSV_WORKERS'] > 1 and can_fork():
+        store = parse_parallel(path, app.config['DATA_CSV_WORKERS'])[0]
+    else:
+        store = parse_columns(path)
+    users = parse_xml_data(app.config['DATA_XML'])
+    return dataplane.publish(
+        directory, store, users, stat.st_size, stat.st_mtime
+    )
+
+
+def import_sqlite(path):
+    """
+    Imports DATA_CSV and DATA_XML into SQLite database.
+
+    Returns:
+        int: number of imported presence entries.
+    """
+    return import_data(
+        path,
+        presence_rows(app.config['DATA_CSV']),
+        parse_xml_data(app.config['DATA_XML']),
+    )
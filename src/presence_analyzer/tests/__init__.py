@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Presence analyzer unit tests.
+"""
+import unittest
+
+
+def suite():
+    """
+    Default test suite.
+    """
+    # pylint: disable=cyclic-import
+    from presence_analyzer.tests import (
+        test_views, test_utils, test_storage, test_background,
+    )
+    base_suite = unittest.TestSuite()
+    base_suite.addTest(
+        unittest.makeSuite(test_views.PresenceAnalyzerViewsTestCase))
+    base_suite.addTest(
+        unittest.makeSuite(test_utils.PresenceAnalyzerUtilsTestCase))
+    base_suite.addTest(
+        unittest.makeSuite(test_utils.PresenceAnalyzerStatsTestCase))
+    base_suite.addTest(
+        unittest.makeSuite(test_storage.PresenceAnalyzerSnapshotTestCase))
+    base_suite.addTest(
+        unittest.makeSuite(test_storage.PresenceAnalyzerStorageTestCase))
+    base_suite.addTest(
+        unittest.makeSuite(test_storage.PresenceAnalyzerDataPlaneTestCase))
+    base_suite.addTest(
+        unittest.makeSuite(test_background.PresenceAnalyzerBackgroundTestCase))
+    return base_suite
+
+
+def load_tests(loader, tests, pattern):  # pylint: disable=unused-argument
+    """
+    Runs the default suite with `python -m unittest presence_analyzer.tests`.
+    """
+    return suite()
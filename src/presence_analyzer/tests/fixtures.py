@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Paths of the test data files.
+"""
+import os.path
+
+
+TEST_DATA_CSV = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'runtime', 'data',
+    'test_data.csv'
+)
+
+TEST_BROKEN_DATA_CSV = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'runtime', 'data',
+    'test_broken_data.csv'
+)
+
+TEST_BROKEN_DATA2_CSV = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'runtime', 'data',
+    'test_broken_data2.csv'
+)
+
+TEST_DATA_XML = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', 'runtime', 'data',
+    'test_users.xml'
+)
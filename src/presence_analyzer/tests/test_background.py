@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the background loading, watching and serving.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from werkzeug.test import Client
+
+from presence_analyzer import (
+    main, utils, storage, benchmark, background, watcher, serving,
+)
+from presence_analyzer.tests.fixtures import (
+    TEST_DATA_CSV, TEST_DATA_XML,
+)
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods, undefined-variable
+# pylint: disable=invalid-name
+class PresenceAnalyzerBackgroundTestCase(unittest.TestCase):
+    """
+    Warm-up and refresher tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, self.csv_path)
+        main.app.config.update({
+            'DATA_CSV': self.csv_path,
+            'DATA_XML': TEST_DATA_XML,
+        })
+        storage.presence_cache.clear()
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        background.background.stop()
+        main.app.config.update({
+            'WARM_UP': None,
+            'WARM_UP_TIMEOUT': 60,
+            'REFRESH_INTERVAL': 0,
+            'WATCH_FILES': False,
+            'WATCH_DEBOUNCE': 1.0,
+            'WATCH_POLL_INTERVAL': 5.0,
+        })
+        shutil.rmtree(self.tmpdir)
+
+    def test_eager_warm_up(self):
+        """
+        Test that data is loaded and indexed before the first request.
+        """
+        main.app.config.update({'WARM_UP': 'eager'})
+        background.background.start()
+        derived = storage.presence_cache.entry.derived
+        self.assertIn(utils.build_aggregates, derived)
+        self.assertIn(utils.build_date_index, derived)
+        self.assertIn(utils.build_timelines, derived)
+        self.assertEqual(
+            storage.users_cache.entry.signature[0], TEST_DATA_XML
+        )
+        resp = self.client.get('/api/v1/_ready')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data), {'ready': True})
+
+    def test_background_warm_up(self):
+        """
+        Test that requests wait for background warm-up.
+        """
+        main.app.config.update({'WARM_UP': 'background'})
+        background.background.start()
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(
+            utils.build_timelines, storage.presence_cache.entry.derived
+        )
+
+        main.app.config.update({'WARM_UP_TIMEOUT': 0.01})
+        background.background.ready.clear()
+        self.addCleanup(background.background.ready.set)
+        resp = self.client.get('/api/v1/_ready')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(json.loads(resp.data), {'ready': False})
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 503)
+
+    def test_failed_warm_up(self):
+        """
+        Test that app isn't ready until data loads after failed warm-up.
+        """
+        os.rename(self.csv_path, self.csv_path + '.tmp')
+        main.app.config.update({'WARM_UP': 'eager', 'REFRESH_INTERVAL': 0.01})
+        background.background.start()
+        self.assertTrue(background.background.ready.is_set())
+        resp = self.client.get('/api/v1/_ready')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(json.loads(resp.data), {'ready': False})
+
+        os.rename(self.csv_path + '.tmp', self.csv_path)
+        self.assertTrue(self.wait_for(
+            lambda: self.client.get('/api/v1/_ready').status_code == 200
+        ))
+
+    def test_refresher(self):
+        """
+        Test that changed files are reloaded by refresher only.
+        """
+        main.app.config.update({'REFRESH_INTERVAL': 0.01})
+        storage.get_data()
+        background.background.start()
+        self.assertTrue(storage.presence_cache.watched)
+        # refresher thread doesn't run while the lock is held
+        with storage.presence_cache.lock:
+            with open(self.csv_path, 'a') as csvfile:
+                csvfile.write('\n12,2013-09-16,09:00:00,17:00:00\n')
+            self.assertNotIn(12, storage.get_data())
+        for __ in range(100):
+            if 12 in storage.get_data():
+                break
+            time.sleep(0.01)
+        self.assertIn(12, storage.get_data())
+        self.assertIn(12, storage.get_aggregates())
+        background.background.stop()
+        self.assertFalse(storage.presence_cache.watched)
+
+    def wait_for(self, condition):
+        """
+        Waits up to a few seconds for condition to become true.
+        """
+        for __ in range(300):
+            if condition():
+                return True
+            time.sleep(0.01)
+        return condition()
+
+    def test_polling_watcher(self):
+        """
+        Test that a burst of changes is reported once, after debounce.
+        """
+        changes = []
+        watch = watcher.PollingWatcher(
+            [self.csv_path], changes.append, debounce=0.2, interval=0.01
+        )
+        watch.start()
+        self.addCleanup(watch.stop)
+        for line in range(3):
+            with open(self.csv_path, 'a') as csvfile:
+                csvfile.write('\n12,2013-09-1{0},09:00:00,17:00:00\n'.format(
+                    line
+                ))
+            time.sleep(0.05)
+        self.assertEqual(changes, [])
+        self.assertTrue(self.wait_for(lambda: changes))
+        time.sleep(0.3)
+        self.assertEqual(changes, [watcher.filesystem_path(self.csv_path)])
+
+    def test_watcher_max_delay(self):
+        """
+        Test that a file changed more often than debounce is reported.
+        """
+        changes = []
+        watch = watcher.Watcher([self.csv_path], changes.append, debounce=0.05)
+        path = watcher.filesystem_path(self.csv_path)
+        started = time.time()
+        while not changes and time.time() - started < 1:
+            watch.changed(path)
+            watch.dispatch()
+            time.sleep(0.01)
+        self.assertEqual(changes, [path])
+        self.assertLess(
+            time.time() - started, 0.05 * watcher.MAX_DEBOUNCES * 2
+        )
+
+    @unittest.skipIf(watcher.libc is None, 'inotify is not available')
+    def test_inotify_watcher(self):
+        """
+        Test that file replaced by rename is reported by inotify.
+        """
+        changes = []
+        watch = watcher.InotifyWatcher(
+            [self.csv_path], changes.append, debounce=0.01
+        )
+        watch.start()
+        self.addCleanup(watch.stop)
+        tmp_path = os.path.join(self.tmpdir, 'data.csv.tmp')
+        shutil.copy(TEST_DATA_CSV, tmp_path)
+        self.assertTrue(self.wait_for(lambda: not watch.pending))
+        self.assertEqual(changes, [])
+        os.rename(tmp_path, self.csv_path)
+        self.assertTrue(self.wait_for(lambda: changes))
+        self.assertEqual(changes, [watcher.filesystem_path(self.csv_path)])
+
+    def test_watch_files(self):
+        """
+        Test that changed file is reloaded and indexed by the watcher.
+        """
+        main.app.config.update({
+            'WATCH_FILES': True,
+            'WATCH_DEBOUNCE': 0.01,
+            'WATCH_POLL_INTERVAL': 0.01,
+        })
+        storage.get_data()
+        background.background.start()
+        self.assertTrue(storage.presence_cache.watched)
+        with open(self.csv_path, 'a') as csvfile:
+            csvfile.write('\n12,2013-09-16,09:00:00,17:00:00\n')
+        self.assertTrue(self.wait_for(lambda: 12 in storage.get_data()))
+        derived = storage.presence_cache.entry.derived
+        self.assertIn(12, derived[utils.build_aggregates])
+        self.assertIn(utils.build_timelines, derived)
+        background.background.stop()
+        self.assertIsNone(background.background.watcher)
+        self.assertFalse(storage.presence_cache.watched)
+
+    def test_offloading(self):
+        """
+        Test that requests run in the pool unless data is in memory.
+        """
+        pooled = []
+
+        class Pool(object):
+            """
+            Pool running functions in the calling thread.
+            """
+
+            @staticmethod
+            def apply(function, args):
+                """
+                Records and calls the function.
+                """
+                result = function(*args)
+                pooled.append(result)
+                return result
+
+        client = Client(
+            serving.Offloading(main.app, Pool()), main.app.response_class
+        )
+        self.assertFalse(serving.data_in_memory())
+        resp = client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(pooled, [[resp.data]])
+        # streamed body is generated in the pool as well
+        resp = client.get('/api/v1/batch?users=10,11')
+        self.assertEqual(b''.join(pooled[-1]), resp.data)
+        self.assertIn('"10":', resp.data)
+        del pooled[:]
+
+        main.app.config.update({'WARM_UP': 'eager', 'WATCH_FILES': True})
+        background.background.start()
+        self.assertTrue(serving.data_in_memory())
+        resp = client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(pooled, [])
+
+        main.app.config.update({'STORAGE': 'sqlite'})
+        self.addCleanup(main.app.config.update, {'STORAGE': 'files'})
+        self.assertFalse(serving.data_in_memory())
+
+    def test_http_load(self):
+        """
+        Test load of server closing connections after every response.
+        """
+
+        class QuietHandler(WSGIRequestHandler):
+            """
+            Handler not logging requests.
+            """
+
+            def log_message(self, *args):
+                pass
+
+            def get_stderr(self):
+                return StringIO()
+
+        server = make_server(
+            '127.0.0.1', 0, main.app, handler_class=QuietHandler
+        )
+        # connections open at the end of the load are closed by client
+        server.handle_error = lambda request, address: None
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        address = server.socket.getsockname()
+        result = benchmark.http_load(
+            address, ['/api/v1/users', '/api/v1/batch', '/api/v1/x'], 3, 0.3
+        )
+        self.assertGreater(result['responses'], 3)
+        # 404 of every third request
+        self.assertEqual(result['errors'], result['responses'] // 3)
+        self.assertIn('p99', result)
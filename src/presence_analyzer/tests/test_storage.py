@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the snapshots, storage backends and data plane.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import shutil
+import struct
+import datetime
+import tempfile
+import threading
+import unittest
+
+from presence_analyzer import (
+    main, utils, columns, snapshot, storage, dataplane, parsing,
+)
+from presence_analyzer.tests.fixtures import (
+    TEST_DATA_CSV, TEST_BROKEN_DATA_CSV, TEST_DATA_XML,
+)
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods, undefined-variable
+# pylint: disable=invalid-name
+class PresenceAnalyzerSnapshotTestCase(unittest.TestCase):
+    """
+    Binary snapshot tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmpdir, 'data.csv')
+        self.path = os.path.join(self.tmpdir, 'data.snapshot')
+        shutil.copy(TEST_DATA_CSV, self.csv_path)
+        main.app.config.update({'DATA_CSV': self.csv_path})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({'DATA_SNAPSHOT': None})
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_read(self):
+        """
+        Test that snapshot holds the same data as the CSV file.
+        """
+        store = snapshot.compile_csv(
+            self.csv_path, self.path, parsing.parse_columns
+        )
+        size, mtime, loaded = snapshot.read(self.path)
+        self.assertEqual(size, os.stat(self.csv_path).st_size)
+        self.assertEqual(mtime, os.stat(self.csv_path).st_mtime)
+        self.assertEqual(loaded, store)
+        self.assertEqual(loaded, parsing.parse_data(self.csv_path))
+        self.assertEqual(
+            utils.build_aggregates(loaded), utils.build_aggregates(store)
+        )
+
+    def test_get_data_from_snapshot(self):
+        """
+        Test that up to date snapshot is loaded instead of the CSV file.
+        """
+        snapshot.compile_csv(self.csv_path, self.path, parsing.parse_columns)
+        main.app.config.update({'DATA_SNAPSHOT': self.path})
+        data = parsing.parse_data(self.csv_path)
+        self.assertIsInstance(data, columns.ColumnStore)
+        self.assertItemsEqual(data.keys(), [10, 11])
+
+    def test_snapshot_shared_without_numpy(self):
+        """
+        Test that loaded snapshot stays mapped also without NumPy.
+        """
+        store = snapshot.compile_csv(
+            self.csv_path, self.path, parsing.parse_columns
+        )
+        self.addCleanup(setattr, snapshot, 'numpy', snapshot.numpy)
+        snapshot.numpy = None
+        loaded = snapshot.load(self.path, self.csv_path)
+        self.assertIsInstance(loaded[10].days, snapshot.MappedColumn)
+        self.assertEqual(loaded, store)
+        self.assertEqual(
+            utils.build_aggregates(loaded), utils.build_aggregates(store)
+        )
+
+    def test_get_data_outdated_snapshot(self):
+        """
+        Test that out of date snapshot is ignored.
+        """
+        snapshot.compile_csv(self.csv_path, self.path, parsing.parse_columns)
+        main.app.config.update({'DATA_SNAPSHOT': self.path})
+        with open(self.csv_path, 'a') as csvfile:
+            csvfile.write('\n12,2013-09-10,09:00:00,17:00:00\n')
+        self.assertIsNone(snapshot.load(self.path, self.csv_path))
+        self.assertIn(12, parsing.parse_data(self.csv_path))
+
+    def test_broken_snapshot(self):
+        """
+        Test that truncated snapshot is rejected.
+        """
+        snapshot.compile_csv(self.csv_path, self.path, parsing.parse_columns)
+        with open(self.path, 'r+b') as snapshot_file:
+            snapshot_file.truncate(40)
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.read(self.path)
+        self.assertIsNone(snapshot.load(self.path, self.csv_path))
+
+
+class PresenceAnalyzerStorageTestCase(unittest.TestCase):
+    """
+    Storage backends tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'data.sqlite')
+        main.app.config.update({
+            'DATA_CSV': TEST_DATA_CSV,
+            'DATA_XML': TEST_DATA_XML,
+            'DATA_DB': self.path,
+        })
+        self.count = storage.import_sqlite(self.path)
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({'STORAGE': 'files', 'DATA_DB': None})
+        shutil.rmtree(self.tmpdir)
+
+    def test_import(self):
+        """
+        Test that database holds the same data as the files.
+        """
+        self.assertEqual(self.count, 9)
+        db = storage.SQLiteStorage(self.path)
+        files = storage.FileStorage()
+        self.assertEqual(db.user_ids(), files.user_ids())
+        self.assertEqual(db.users(), files.users())
+        for user_id in files.user_ids():
+            self.assertEqual(
+                db.user_aggregates(user_id), files.user_aggregates(user_id)
+            )
+            self.assertEqual(
+                list(db.timeline(user_id).totals),
+                list(files.timeline(user_id).totals),
+            )
+        self.assertIsNone(db.user_aggregates(666))
+        self.assertIsNone(db.timeline(666))
+
+    def test_date_range(self):
+        """
+        Test that date range queries match the in-memory backend.
+        """
+        db = storage.SQLiteStorage(self.path)
+        first = datetime.date(2013, 9, 6)
+        last = datetime.date(2013, 9, 12)
+        for user_id in db.user_ids():
+            self.assertEqual(
+                db.user_aggregates(user_id, first, last),
+                storage.get_user_aggregates(user_id, first, last),
+            )
+            self.assertEqual(
+                db.user_aggregates(user_id, last, first), [[0, 0, 0, 0]] * 7
+            )
+
+    def test_aggregates_lookup(self):
+        """
+        Test that aggregates of all users computed by SQLite match.
+        """
+        db = storage.SQLiteStorage(self.path)
+        for first, last in ((None, None), (datetime.date(2013, 9, 10), None)):
+            lookup = db.aggregates_lookup(first, last)
+            expected = storage.aggregates_lookup(first, last)
+            for user_id in db.user_ids() + [666]:
+                self.assertEqual(lookup(user_id), expected(user_id))
+
+    def test_views(self):
+        """
+        Test that views return the same responses from both backends.
+        """
+        urls = [
+            '/api/v1/users',
+            '/api/v1/presence_weekday/10',
+            '/api/v1/mean_time_weekday/11?from=2013-09-06',
+            '/api/v1/presence_weekday/10?from=',
+            '/api/v1/presence_start_end/10',
+            '/api/v1/presence_trend/10?period=month',
+            '/api/v1/batch',
+            '/api/v1/user_avatar/10',
+            '/api/v1/presence_weekday/666',
+        ]
+        expected = [self.client.get(url) for url in urls]
+        main.app.config.update({'STORAGE': 'sqlite'})
+        self.assertIsInstance(storage.get_storage(), storage.SQLiteStorage)
+        for url, response in zip(urls, expected):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, response.status_code)
+            self.assertEqual(resp.data, response.data)
+
+    def test_reimport(self):
+        """
+        Test that connections are reopened after database is replaced.
+        """
+        main.app.config.update({'STORAGE': 'sqlite'})
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        etag = resp.headers['ETag']
+        main.app.config.update({'DATA_CSV': TEST_BROKEN_DATA_CSV})
+        storage.import_sqlite(self.path)
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        main.app.config.update({'STORAGE': 'files'})
+        self.assertEqual(
+            resp.data, self.client.get('/api/v1/presence_weekday/10').data
+        )
+
+
+class PresenceAnalyzerDataPlaneTestCase(unittest.TestCase):
+    """
+    Shared data plane tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.tmpdir = tempfile.mkdtemp()
+        main.app.config.update({
+            'DATA_CSV': TEST_DATA_CSV,
+            'DATA_XML': TEST_DATA_XML,
+            'DATA_PLANE': self.tmpdir,
+        })
+        self.name = storage.publish_data_plane(self.tmpdir)
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({'STORAGE': 'files', 'DATA_PLANE': None})
+        shutil.rmtree(self.tmpdir)
+
+    def test_views(self):
+        """
+        Test that views return the same responses from shared data.
+        """
+        urls = [
+            '/api/v1/users',
+            '/api/v1/presence_weekday/10',
+            '/api/v1/mean_time_weekday/11?from=2013-09-06',
+            '/api/v1/presence_start_end/10?to=2013-09-10',
+            '/api/v1/presence_trend/10?period=month',
+            '/api/v1/batch',
+            '/api/v1/batch?from=2013-09-10',
+            '/api/v1/user_avatar/10',
+            '/api/v1/presence_weekday/666',
+        ]
+        expected = [self.client.get(url) for url in urls]
+        main.app.config.update({'STORAGE': 'shared'})
+        self.assertIsInstance(storage.get_storage(), storage.SharedStorage)
+        for url, response in zip(urls, expected):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, response.status_code)
+            self.assertEqual(resp.data, response.data)
+
+    def test_generation_swap(self):
+        """
+        Test that workers attach new generation and old ones are pruned.
+        """
+        main.app.config.update({'STORAGE': 'shared'})
+        plane = storage.get_storage().plane
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(plane.get().name, self.name)
+        generation = plane.get()
+        self.assertIs(plane.get(), generation)
+
+        main.app.config.update({'DATA_CSV': TEST_BROKEN_DATA_CSV})
+        names = [storage.publish_data_plane(self.tmpdir) for __ in range(4)]
+        self.assertEqual(dataplane.current(self.tmpdir), names[-1])
+        self.assertItemsEqual(
+            [name for name in os.listdir(self.tmpdir) if name != 'current'],
+            names[-dataplane.KEEP_GENERATIONS:],
+        )
+        new = self.client.get('/api/v1/presence_weekday/10')
+        self.assertNotEqual(new.headers['ETag'], resp.headers['ETag'])
+        self.assertEqual(plane.get().name, names[-1])
+        # the old generation stays usable by requests still holding it
+        self.assertEqual(len(generation.store[10]), 3)
+
+    def test_generation_derive(self):
+        """
+        Test values derived from a generation are computed once.
+        """
+        main.app.config.update({'STORAGE': 'shared'})
+        backend = storage.get_storage()
+        generation = backend.plane.get()
+        calls = []
+        started = threading.Event()
+
+        def slow(store):
+            """
+            Derives value slowly enough for all threads to ask for it.
+            """
+            calls.append(store)
+            started.wait(1)
+            return len(store)
+
+        threads = [
+            threading.Thread(target=generation.derive, args=(slow,))
+            for __ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        started.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(generation.derive(slow), 2)
+
+        # date ranges and timelines read the shared columns, only the
+        # all-days aggregates are kept in every process
+        backend.warm_up()
+        backend.aggregates_lookup(datetime.date(2013, 9, 10))(10)
+        backend.timeline(10)
+        self.assertItemsEqual(
+            generation.derived, [slow, utils.build_aggregates]
+        )
+
+    def test_mapped_column(self):
+        """
+        Test column read from mapped snapshot without NumPy.
+        """
+        values = [735110, 735111, 735115, 735120]
+        data = b'xxxx' + struct.pack('<4i', *values)
+        column = snapshot.MappedColumn(data, 4, 4)
+        self.assertEqual(len(column), 4)
+        self.assertEqual(list(column), values)
+        self.assertEqual(column[-1], 735120)
+        self.assertEqual(column[1:3].tolist(), values[1:3])
+        self.assertEqual(column[3:1].tolist(), [])
+        self.assertEqual(column[::2], values[::2])
+        with self.assertRaises(IndexError):
+            column[4]  # pylint: disable=pointless-statement
+        items = columns.UserColumns(column, column, column)
+        self.assertEqual(items.find(735115), (735115, 735115))
+        self.assertEqual(
+            list(items.between(735111, 735115).rows()),
+            [(735111, 735111, 735111), (735115, 735115, 735115)],
+        )
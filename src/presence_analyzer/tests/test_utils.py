@@ -0,0 +1,830 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the file cache, parsing and statistics helpers.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import json
+import time
+import shutil
+import random
+import datetime
+import tempfile
+import threading
+import unittest
+
+from presence_analyzer import (
+    main, utils, columns, stats, storage, benchmark, profiling, memo,
+    filecache, parsing,
+)
+from presence_analyzer.tests.fixtures import (
+    TEST_DATA_CSV, TEST_BROKEN_DATA_CSV, TEST_BROKEN_DATA2_CSV, TEST_DATA_XML,
+)
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods, undefined-variable
+# pylint: disable=invalid-name
+class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
+    """
+    Utility functions tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        pass
+
+    def test_memo_cache(self):
+        """
+        Test eviction, expiration and invalidation of memo cache.
+        """
+        limits = [3, 100, None]
+        cache = memo.MemoCache(lambda: limits)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1, 10, 'csv')
+        cache.put('b', 2, 10, 'csv')
+        cache.put('c', 3, 10, 'xml')
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('d', 4, 10, 'xml')  # evicts 'b', used less than 'a'
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('e', 5, 80, 'xml')  # 110 bytes, evicts 'c'
+        self.assertEqual(sorted(cache.entries), ['a', 'd', 'e'])
+        cache.put('f', 6, 101)
+        self.assertIsNone(cache.get('f'))
+        cache.put('e', 5, 50, 'xml')
+        self.assertEqual(cache.stats(), {
+            'entries': 3, 'bytes': 70, 'hits': 2, 'misses': 3,
+            'evictions': 2, 'expirations': 0, 'invalidations': 0,
+        })
+
+        cache.invalidate('xml', 1)
+        self.assertEqual(len(cache), 3)
+        cache.invalidate('xml', 1)
+        cache.invalidate('xml', 2)
+        self.assertEqual(sorted(cache.entries), ['a'])
+        self.assertEqual(cache.size, 10)
+        self.assertEqual(cache.stats()['invalidations'], 2)
+
+        limits[2] = 0.01
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.size, 0)
+        limits[0] = 0
+        cache.put('a', 1, 10)
+        self.assertEqual(len(cache), 0)
+        limits[:] = [None, None, None]
+        for key in range(5):
+            cache.put(key, key, 10)
+        self.assertEqual(len(cache), 5)
+        self.assertEqual(cache.get(0), 0)
+
+    def test_get_data(self):
+        """
+        Test parsing of CSV file.
+        """
+        data = utils.get_data()
+        self.assertIsInstance(data, dict)
+        self.assertItemsEqual(data.keys(), [10, 11])
+        sample_date = datetime.date(2013, 9, 10)
+        self.assertIn(sample_date, data[10])
+        self.assertItemsEqual(data[10][sample_date].keys(), ['start', 'end'])
+        self.assertEqual(
+            data[10][sample_date]['start'],
+            datetime.time(9, 39, 5)
+        )
+
+    def test_get_data_cached(self):
+        """
+        Test that parsed CSV file is kept in memory between calls.
+        """
+        self.assertIs(storage.get_data(), storage.get_data())
+
+    def test_get_data_reloaded_on_change(self):
+        """
+        Test that CSV file is parsed again after it has been modified.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, path)
+        main.app.config.update({'DATA_CSV': path})
+        self.assertItemsEqual(storage.get_data().keys(), [10, 11])
+
+        with open(path, 'a') as csvfile:
+            csvfile.write('\n12,2013-09-10,09:00:00,17:00:00\n')
+        self.assertItemsEqual(storage.get_data().keys(), [10, 11, 12])
+
+    def test_get_data_appended(self):
+        """
+        Test that only lines appended to CSV file are parsed.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, path)
+        loads = []
+
+        def loader(path):
+            """
+            Loader which records its calls.
+            """
+            loads.append(path)
+            return parsing.parse_data(path)
+
+        for store in ('dict', 'columns'):
+            main.app.config.update({'DATA_STORE': store})
+            self.addCleanup(main.app.config.update, {'DATA_STORE': 'dict'})
+            cache = filecache.FileCache(loader, extend=parsing.extend_data)
+            del loads[:]
+            cache.derive(path, utils.build_aggregates)
+
+            with open(path, 'a') as csvfile:
+                # replaces existing day and adds new user
+                csvfile.write('\n10,2013-09-10,08:00:00,16:00:00\n')
+                csvfile.write('12,2013-09-10,09:00:00,17:')
+            self.assertNotIn(12, cache.get(path))
+            with open(path, 'a') as csvfile:
+                csvfile.write('00:00\n12,2013-09-11,09:00:00,17:00:00\n')
+
+            aggregates = cache.derive(path, utils.build_aggregates)
+            self.assertEqual(len(loads), 1)
+            self.assertItemsEqual(cache.get(path).keys(), [10, 11, 12])
+            self.assertEqual(cache.get(path), parsing.parse_data(path))
+            self.assertEqual(
+                aggregates, utils.build_aggregates(parsing.parse_data(path))
+            )
+            shutil.copy(TEST_DATA_CSV, path)
+
+    def test_extend_gets_copy_of_derived(self):
+        """
+        Test that extend doesn't iterate values `derive` may add to.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, path)
+        passed = []
+
+        def extend(data, derived, path, offset):
+            """
+            Records derived values it gets.
+            """
+            passed.append(derived)
+            return parsing.extend_data(data, derived, path, offset)
+
+        cache = filecache.FileCache(parsing.parse_data, extend=extend)
+        cache.derive(path, utils.build_aggregates)
+        entry = cache.entry
+        with open(path, 'a') as csvfile:
+            csvfile.write('\n12,2013-09-10,09:00:00,17:00:00\n')
+        self.assertIn(12, cache.get(path))
+        self.assertEqual(passed, [entry.derived])
+        self.assertIsNot(passed[0], entry.derived)
+
+    def test_get_data_truncated(self):
+        """
+        Test that truncated or rewritten CSV file is parsed from scratch.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, path)
+        cache = filecache.FileCache(
+            parsing.parse_data, extend=parsing.extend_data
+        )
+        self.assertIn(11, cache.get(path))
+
+        with open(path, 'r+') as csvfile:
+            csvfile.truncate(70)
+        self.assertNotIn(11, cache.get(path))
+
+        with open(path, 'w') as csvfile:
+            with open(TEST_DATA_CSV) as source:
+                csvfile.write(source.read().replace('10,', '12,'))
+        self.assertItemsEqual(cache.get(path).keys(), [12, 11])
+
+    def test_file_cache_single_flight(self):
+        """
+        Test that concurrent callers share a single parse of the file.
+        """
+        calls = []
+
+        def loader(path):
+            """
+            Slow loader which records its calls.
+            """
+            calls.append(path)
+            time.sleep(0.05)
+            return len(calls)
+
+        cache = filecache.FileCache(loader)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get(TEST_DATA_CSV))
+            )
+            for __ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [1] * 10)
+
+    def test_get_xml_data(self):
+        """
+        Test parsing of XML file.
+        """
+        data = utils.get_xml_data()
+        self.assertIsInstance(data, dict)
+        self.assertItemsEqual(data.keys(), ['10', '11'])
+        self.assertEqual('Maciej Z.', data['10']['name'])
+        self.assertEqual(
+            'https://intranet.stxnext.pl/api/images/users/10',
+            data['10']['avatar'],
+        )
+
+    def test_get_xml_data_reloaded_in_background(self):
+        """
+        Test that replaced XML file is parsed again in the background.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'users.xml')
+        shutil.copy(TEST_DATA_XML, path)
+        main.app.config.update({'DATA_XML': path})
+        old_data = storage.get_xml_data()
+        reloads = storage.users_cache.reloads
+
+        with open(path + '.new', 'w') as xmlfile:
+            with open(TEST_DATA_XML) as source:
+                xmlfile.write(source.read().replace('Maciej Z.', 'Adam P.'))
+        os.rename(path + '.new', path)
+
+        self.assertIs(storage.get_xml_data(), old_data)
+        storage.users_cache.thread.join()
+        self.assertEqual('Adam P.', storage.get_xml_data()['10']['name'])
+        self.assertEqual(storage.users_cache.reloads, reloads + 1)
+        self.assertIsNotNone(storage.users_cache.reloaded_at)
+
+    def test_get_xml_data_broken_file_keeps_old_data(self):
+        """
+        Test that half-written XML file doesn't replace parsed data.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'users.xml')
+        shutil.copy(TEST_DATA_XML, path)
+        main.app.config.update({'DATA_XML': path})
+        old_data = storage.get_xml_data()
+        reloads = storage.users_cache.reloads
+
+        with open(path, 'w') as xmlfile:
+            xmlfile.write('<?xml version="1.0" encoding="UTF-8" ?>\n<intr')
+        storage.get_xml_data()
+        storage.users_cache.thread.join()
+
+        self.assertIs(storage.get_xml_data(), old_data)
+        self.assertEqual(storage.users_cache.reloads, reloads)
+
+    def test_get_data_broken_datasource(self):
+        """
+        Test parsing of CSV file - testing broken data (bad types).
+        """
+        main.app.config.update({'DATA_CSV': TEST_BROKEN_DATA_CSV})
+        data_broken = utils.get_data()
+        self.assertEqual(len(data_broken[11]), 5)
+
+    def test_get_data_broken_datasource2(self):
+        """
+        Test parsing of CSV file - testing broken data (additional column).
+        """
+        main.app.config.update({'DATA_CSV': TEST_BROKEN_DATA2_CSV})
+        data_broken2 = utils.get_data()
+        self.assertEqual(len(data_broken2), 0)
+
+    def test_get_data_fast_parser(self):
+        """
+        Test that fast and strict CSV parsers give the same result.
+        """
+        for path in (TEST_DATA_CSV, TEST_BROKEN_DATA_CSV):
+            main.app.config.update({'CSV_PARSER': 'strict'})
+            strict = parsing.parse_data(path)
+            main.app.config.update({'CSV_PARSER': 'fast'})
+            self.assertEqual(parsing.parse_data(path), strict)
+
+    def test_iter_presence(self):
+        """
+        Test streaming presence records.
+        """
+        records = list(parsing.iter_presence(TEST_DATA_CSV))
+        self.assertEqual(len(records), 9)
+        self.assertEqual(records[0].user_id, 10)
+        self.assertEqual(records[0].date, datetime.date(2013, 9, 10))
+        self.assertEqual(
+            parsing.collect_presence(records),
+            parsing.parse_data(TEST_DATA_CSV),
+        )
+
+    def test_presence_pipeline(self):
+        """
+        Test filtering, grouping and aggregating presence records.
+        """
+        first = datetime.date(2013, 9, 10)
+        records = parsing.filter_presence(
+            parsing.iter_presence(TEST_DATA_CSV), user_ids={11}, first=first
+        )
+        grouped = [
+            (user_id, list(user_records))
+            for user_id, user_records in parsing.group_by_user(records)
+        ]
+        self.assertEqual([user_id for user_id, __ in grouped], [11])
+        self.assertEqual(len(grouped[0][1]), 4)
+        self.assertTrue(all(record.date >= first for record in grouped[0][1]))
+
+        self.assertEqual(
+            parsing.aggregate_by_weekday(parsing.iter_presence(TEST_DATA_CSV)),
+            utils.build_aggregates(storage.get_data()),
+        )
+
+    def test_fast_row_parser(self):
+        """
+        Test parsing rows in and out of the fixed-width layout.
+        """
+        parse_row = parsing.make_fast_row_parser()
+        self.assertEqual(
+            parse_row(['10', '2013-09-10', '09:39:05', '17:59:52']),
+            (
+                10, datetime.date(2013, 9, 10),
+                datetime.time(9, 39, 5), datetime.time(17, 59, 52),
+            )
+        )
+        self.assertEqual(
+            parse_row(['10', '2013-9-10', '9:39:05', '17:59:52']),
+            (
+                10, datetime.date(2013, 9, 10),
+                datetime.time(9, 39, 5), datetime.time(17, 59, 52),
+            )
+        )
+        with self.assertRaises(ValueError):
+            parse_row(['10', '2013-09-31', '09:39:05', '17:59:52'])
+        with self.assertRaises(ValueError):
+            parse_row(['10', '2013-+9-10', '09:39:05', '17:59:52'])
+
+    def test_get_data_columns(self):
+        """
+        Test that columnar store behaves like nested dicts.
+        """
+        main.app.config.update({'DATA_STORE': 'columns'})
+        self.addCleanup(main.app.config.update, {'DATA_STORE': 'dict'})
+        for path in (TEST_DATA_CSV, TEST_BROKEN_DATA_CSV):
+            data = parsing.parse_data(path)
+            self.assertIsInstance(data, columns.ColumnStore)
+            main.app.config.update({'DATA_STORE': 'dict'})
+            expected = parsing.parse_data(path)
+            main.app.config.update({'DATA_STORE': 'columns'})
+            self.assertEqual(data, expected)
+            self.assertEqual(
+                utils.build_aggregates(data), utils.build_aggregates(expected)
+            )
+
+    def test_columns_repeated_days(self):
+        """
+        Test that last entry of repeated day wins in columnar store.
+        """
+        store = columns.ColumnStore.from_rows([
+            (10, 735121, 32400, 61200),
+            (10, 735120, 30000, 60000),
+            (10, 735121, 36000, 64800),
+        ])
+        self.assertEqual(list(store[10].days), [735120, 735121])
+        self.assertEqual(
+            store[10][datetime.date.fromordinal(735121)],
+            {'start': datetime.time(10, 0, 0), 'end': datetime.time(18, 0, 0)}
+        )
+        self.assertNotIn('not a date', store[10])
+
+    def test_parse_parallel(self):
+        """
+        Test that parsing in worker processes gives the same data.
+        """
+        main.app.config.update({'DATA_CSV_WORKERS': 3})
+        self.addCleanup(main.app.config.update, {'DATA_CSV_WORKERS': 1})
+        for path in (TEST_DATA_CSV, TEST_BROKEN_DATA_CSV):
+            expected = parsing.parse_data(path)
+            for store in ('dict', 'columns'):
+                main.app.config.update({'DATA_STORE': store})
+                self.addCleanup(
+                    main.app.config.update, {'DATA_STORE': 'dict'}
+                )
+                result = parsing.load_data(path)
+                self.assertEqual(result.value, expected)
+                self.assertEqual(
+                    result.derived[utils.build_aggregates],
+                    utils.build_aggregates(expected),
+                )
+
+        # not forked from a process running other threads
+        self.assertTrue(parsing.can_fork())
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(parsing.load_data(TEST_DATA_CSV))
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(results[0].value, parsing.parse_data(TEST_DATA_CSV))
+        self.assertEqual(results[0].derived, {})
+
+    def test_split_ranges(self):
+        """
+        Test that file is split on line boundaries.
+        """
+        ranges = parsing.split_ranges(TEST_DATA_CSV, 4)
+        with open(TEST_DATA_CSV, 'rb') as csvfile:
+            content = csvfile.read()
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(content))
+        for (__, end), (start, __) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(content[end - 1], '\n')
+        self.assertEqual(parsing.split_ranges(TEST_DATA_CSV, 1), [
+            (0, len(content))
+        ])
+
+    def test_parse_parallel_repeated_days(self):
+        """
+        Test that aggregates aren't passed on when chunks repeat days.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'repeated.csv')
+        with open(path, 'w') as csvfile:
+            csvfile.write('10,2013-09-10,09:00:00,17:00:00\n' * 50)
+        store, derived = parsing.parse_parallel(path, 2)
+        self.assertEqual(list(store[10].days), [735121])
+        self.assertEqual(derived, {})
+
+    def test_benchmark_suite(self):
+        """
+        Test that benchmark suite measures every endpoint on generated data.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        csv_path = os.path.join(tmpdir, 'data.csv')
+        xml_path = os.path.join(tmpdir, 'users.xml')
+        self.assertEqual(benchmark.generate_csv(csv_path, 3, 20), 60)
+        benchmark.generate_xml(xml_path, 3)
+        results = benchmark.benchmark_suite(csv_path, xml_path, 3, 5)
+        self.assertEqual(len(storage.get_xml_data()), 3)
+        for key in ('endpoints', 'cached_endpoints'):
+            self.assertItemsEqual(results[key], benchmark.ENDPOINTS)
+            for endpoint in results[key].itervalues():
+                self.assertLessEqual(endpoint['p50'], endpoint['p99'])
+        self.assertEqual(main.app.config['RESPONSE_CACHE_SIZE'], 1000)
+        report = benchmark.suite_report(results, 3, 20, 60)
+        comparison = list(benchmark.compare_results(results, results))
+        self.assertEqual(
+            len(comparison), 2 * 5 * len(benchmark.ENDPOINTS) + 4 + 3 + 1
+        )
+        self.assertEqual(set(row[3] for row in comparison), {1.0})
+        self.assertEqual(json.loads(json.dumps(report))['scale']['rows'], 60)
+
+    def test_sampler(self):
+        """
+        Test that sampled stacks are written in folded format.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'samples.folded')
+        event = threading.Event()
+
+        def waiting_for_sampler():
+            """
+            Blocks until the test is done sampling.
+            """
+            event.wait()
+
+        thread = threading.Thread(target=waiting_for_sampler)
+        thread.start()
+        sampler = profiling.Sampler()
+        sampler.start(0.001, path)
+        time.sleep(0.05)
+        sampler.stop()
+        event.set()
+        thread.join()
+        with open(path) as samples:
+            lines = samples.read().splitlines()
+        stacks = [line.rsplit(' ', 1) for line in lines]
+        self.assertTrue(any(
+            ';waiting_for_sampler (test_utils.py:' in stack
+            for stack, __ in stacks
+        ))
+        self.assertTrue(all(int(count) > 0 for __, count in stacks))
+
+    def test_to_columns(self):
+        """
+        Test converting nested dicts to columnar store.
+        """
+        data = storage.get_data()
+        store = utils.to_columns(data)
+        self.assertEqual(store, data)
+        self.assertIs(utils.to_columns(store), store)
+
+    def test_group_by_weekday_list(self):
+        """
+        Test grouping by weekday.
+        Checks if the result is a list.
+        """
+        data = utils.get_data()
+        grouped_by_weekday = utils.group_by_weekday(data[10])
+        self.assertIsInstance(grouped_by_weekday, list)
+
+    def test_group_by_weekday_incorrect_input(self):
+        """
+        Test grouping by weekday.
+        Incorrect input type.
+        """
+        with self.assertRaises(TypeError):
+            utils.group_by_weekday({'first': 123, 'second': '123'})
+
+    def test_group_start_end_list(self):
+        """
+        Test grouping starts and ends by weekday.
+        Checks if the result is a list.
+        """
+        data = utils.get_data()
+        grouped_by_weekday = utils.group_start_end(data[10])
+        self.assertIsInstance(grouped_by_weekday, list)
+
+    def test_group_start_end_incorrect_input(self):
+        """
+        Test grouping starts and ends by weekday.
+        Incorrect input type.
+        """
+        with self.assertRaises(TypeError):
+            utils.group_by_weekday({'first': 123, 'second': '123'})
+
+    def test_mean_start_stop_list(self):
+        """
+        Test counting starts and ends by weekday.
+        Checks if the result is a list.
+        """
+        data = utils.get_data()
+        counted_by_weekday = utils.mean_start_stop(data[10])
+        self.assertIsInstance(counted_by_weekday, list)
+
+    def test_mean_start_stop_incorrect_input(self):
+        """
+        Test counting starts and ends by weekday.
+        Incorrect input type.
+        """
+        with self.assertRaises(TypeError):
+            utils.mean_start_stop({'first': 123, 'second': '123'})
+
+    def test_get_aggregates(self):
+        """
+        Test that aggregates match grouping functions.
+        """
+        data = storage.get_data()
+        aggregates = storage.get_aggregates()
+        self.assertItemsEqual(aggregates.keys(), data.keys())
+        for user_id, items in data.iteritems():
+            intervals = utils.group_by_weekday(items)
+            means = utils.mean_start_stop(items)
+            for weekday, (count, total, starts, ends) in enumerate(
+                    aggregates[user_id]):
+                self.assertEqual(count, len(intervals[weekday]))
+                self.assertEqual(total, sum(intervals[weekday]))
+                self.assertEqual(
+                    utils.safe_mean(starts, count), means[weekday]['Start']
+                )
+                self.assertEqual(
+                    utils.safe_mean(ends, count), means[weekday]['End']
+                )
+
+    def test_get_user_aggregates_date_range(self):
+        """
+        Test that date range sums match filtering entries.
+        """
+        data = storage.get_data()
+        first = datetime.date(2013, 9, 6)
+        last = datetime.date(2013, 9, 12)
+        for user_id, items in data.iteritems():
+            expected = utils.weekday_aggregates({
+                date: entry for date, entry in items.iteritems()
+                if first <= date <= last
+            })
+            self.assertEqual(
+                storage.get_user_aggregates(user_id, first, last), expected
+            )
+            self.assertEqual(
+                storage.get_user_aggregates(user_id, last, first),
+                [[0, 0, 0, 0]] * 7,
+            )
+            self.assertEqual(
+                storage.get_user_aggregates(user_id, None, last),
+                utils.weekday_aggregates({
+                    date: entry for date, entry in items.iteritems()
+                    if date <= last
+                })
+            )
+        self.assertIsNone(storage.get_user_aggregates(666, first, last))
+
+    def test_get_aggregates_cached(self):
+        """
+        Test that aggregates are computed once for every data load.
+        """
+        self.assertIs(storage.get_aggregates(), storage.get_aggregates())
+
+    def test_weekday_aggregates(self):
+        """
+        Test summing entries of single user by weekday.
+        """
+        items = {
+            datetime.date(2013, 9, 10): {
+                'start': datetime.time(9, 0, 0),
+                'end': datetime.time(17, 0, 0),
+            },
+            datetime.date(2013, 9, 17): {
+                'start': datetime.time(8, 0, 0),
+                'end': datetime.time(16, 30, 0),
+            },
+        }
+        result = utils.weekday_aggregates(items)
+        self.assertEqual(len(result), 7)
+        self.assertEqual(result[0], [0, 0, 0, 0])
+        self.assertEqual(result[1], [2, 59400, 61200, 120600])
+
+    def test_weekday_summary(self):
+        """
+        Test statistics of presence intervals of single user by weekday.
+        """
+        data = storage.get_data()
+        result = utils.weekday_summary(data[11], (50, 100))
+        self.assertEqual(len(result), 7)
+        self.assertEqual(result[0], {
+            'count': 1,
+            'total': 24123,
+            'mean': 24123.0,
+            'median': 24123,
+            'percentiles': {50: 24123, 100: 24123},
+        })
+        self.assertEqual(result[5]['count'], 0)
+        self.assertEqual(result[5]['median'], 0)
+
+    def test_percentile(self):
+        """
+        Test percentile with linear interpolation.
+        """
+        self.assertEqual(utils.percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(utils.percentile([1, 2, 3, 4], 100), 4)
+        self.assertEqual(utils.percentile([10], 25), 10)
+        self.assertEqual(utils.percentile([], 50), 0)
+
+    def test_safe_mean(self):
+        """
+        Test returning arithmetic mean from sum and count or zero if empty.
+        """
+        self.assertEqual(utils.safe_mean(64, 4), 16)
+        self.assertEqual(utils.safe_mean(0, 0), 0)
+
+    def test_seconds_since_midnight(self):
+        """
+        Test calculating seconds since midnight.
+        Checks if the result is correct.
+        """
+        example_times = [
+            [datetime.time(17, 30, 15), 63015],  # 17*3600 + 30*60 + 15 = 63015
+            [datetime.time(11, 20, 0), 40800],   # 11*3600 + 20*60 + 0  = 40800
+        ]
+
+        for example_time in example_times:
+            self.assertEqual(
+                utils.seconds_since_midnight(example_time[0]),
+                example_time[1]
+            )
+
+    def test_seconds_since_midnight_incorrect_input(self):
+        """
+        Test calculating seconds since midnight.
+        Incorrect input type.
+        """
+        with self.assertRaises(AttributeError):
+            utils.seconds_since_midnight('some string')
+
+    def test_interval(self):
+        """
+        Test calculating amount of time between two datetime.time objects.
+        Checks if the result is correct.
+        """
+        self.assertEqual(
+            utils.interval(
+                datetime.time(11, 20, 0),
+                datetime.time(17, 30, 15),
+            ),
+            22215
+        )
+
+    def test_interval_incorrect_input(self):
+        """
+        Test calculating amount of time between two datetime.time objects.
+        Incorrect input type.
+        """
+        with self.assertRaises(AttributeError):
+            utils.interval('not a datetime.time', 'object')
+
+    def test_mean(self):
+        """
+        Test returning arithmetic mean or zero if empty.
+        Check if the result is correct.
+        """
+        self.assertEqual(utils.mean([1, 39, 22, 2]), 16)
+        self.assertEqual(utils.mean([]), 0)
+
+    def test_mean_incorrect_input(self):
+        """
+        Test returning arithmetic mean or zero if empty.
+        Incorrect input type.
+        """
+        with self.assertRaises(TypeError):
+            utils.mean('not a list')
+
+
+@unittest.skipUnless(stats.available(), 'NumPy is not installed')
+class PresenceAnalyzerStatsTestCase(unittest.TestCase):
+    """
+    NumPy statistics engine tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'STATS_ENGINE': 'python'})
+        rand = random.Random(0)
+        self.store = columns.ColumnStore.from_rows(
+            (user_id, day, start, start + rand.randint(0, 36000))
+            for user_id in range(10, 20)
+            for day in range(735000, 735000 + rand.randint(0, 300))
+            for start in [rand.randint(25200, 39600)]
+        )
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        main.app.config.update({'STATS_ENGINE': 'python'})
+
+    def test_aggregates_parity(self):
+        """
+        Test that NumPy aggregates are identical to Python ones.
+        """
+        for data in (self.store, utils.to_columns(storage.get_data())):
+            self.assertEqual(
+                stats.aggregates(data), utils.build_aggregates(data)
+            )
+
+    def test_summary_parity(self):
+        """
+        Test that NumPy summary is identical to Python one.
+        """
+        for data in (self.store, utils.to_columns(storage.get_data())):
+            self.assertEqual(
+                stats.summary(data, (10, 50, 99)),
+                utils.build_summary(data, (10, 50, 99)),
+            )
+
+    def test_empty_store(self):
+        """
+        Test statistics of store without entries.
+        """
+        store = columns.ColumnStore({})
+        self.assertEqual(stats.aggregates(store), {})
+        self.assertEqual(stats.summary(store), {})
+
+    def test_engine_selected_by_config(self):
+        """
+        Test that STATS_ENGINE switches aggregates to NumPy.
+        """
+        main.app.config.update({'STATS_ENGINE': 'numpy'})
+        self.assertEqual(
+            utils.build_aggregates(self.store),
+            stats.aggregates(self.store),
+        )
+        resp = main.app.test_client().get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
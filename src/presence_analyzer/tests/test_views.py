@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the views.
+"""
+from __future__ import unicode_literals
+
+import os
+import os.path
+import sys
+import json
+import shutil
+import zlib
+import tempfile
+import unittest
+
+from presence_analyzer import (
+    main, metrics, responses,
+)
+from presence_analyzer.tests.fixtures import (
+    TEST_DATA_CSV, TEST_BROKEN_DATA_CSV, TEST_DATA_XML,
+)
+
+
+# pylint: disable=maybe-no-member, too-many-public-methods, undefined-variable
+# pylint: disable=invalid-name
+class PresenceAnalyzerViewsTestCase(unittest.TestCase):
+    """
+    Views tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+        main.app.config.update({'DATA_XML': TEST_DATA_XML})
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        pass
+
+    def test_mainpage(self):
+        """
+        Test main page redirect.
+        """
+        resp = self.client.get('/')
+        self.assertEqual(resp.status_code, 302)
+        assert resp.headers['Location'].endswith('/presence_weekday.html')
+
+    def test_api_users(self):
+        """
+        Test users listing.
+        """
+        resp = self.client.get('/api/v1/users')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 2)
+        self.assertDictEqual(data[0], {
+            'user_id': '11',
+            'name': 'Maciej D.',
+        })
+
+    def test_mean_time_weekday_view_negative(self):
+        """
+        Test mean presence time grouped by weekday for given user.
+        Part with incorrect data - user_id doesn't exists.
+        """
+        resp = self.client.get('/api/v1/mean_time_weekday/666')
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.content_type, 'text/html')
+
+    def test_mean_time_weekday_view_positive(self):
+        """
+        Test mean presence time grouped by weekday for given user.
+        Part with correct data - user_id exists.
+        """
+        resp = self.client.get('/api/v1/mean_time_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 7)
+        self.assertEqual(len(data[0]), 2)
+        self.assertEqual(type(data[0][0]), unicode)
+        self.assertEqual(type(data[0][1]), int)
+
+    def test_presence_weekday_view_negative(self):
+        """
+        Test total presence time for given user grouped by weekday.
+        Part with incorrect data - user_id doesn't exists.
+        """
+        resp = self.client.get('/api/v1/presence_weekday/666')
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.content_type, 'text/html')
+
+    def test_presence_weekday_view_positive(self):
+        """
+        Test mean presence time grouped by weekday for given user.
+        Part with correct data - user_id exists.
+        """
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 8)
+        self.assertEqual(len(data[0]), 2)
+        # skip first row because it contains labels not the data
+        self.assertEqual(type(data[1][0]), unicode)
+        self.assertEqual(type(data[1][1]), int)
+
+    def test_presence_start_end_view_negative(self):
+        """
+        Test presence mean time start/end for given user grouped by weekday.
+        Part with incorrect data - user_id doesn't exists.
+        """
+        resp = self.client.get('/api/v1/presence_start_end/666')
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.content_type, 'text/html')
+
+    def test_presence_start_end_view_positive(self):
+        """
+        Test mean presence time grouped by weekday for given user.
+        Part with correct data - user_id exists.
+        """
+        resp = self.client.get('/api/v1/presence_start_end/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 7)
+        self.assertEqual(len(data[0]), 3)
+        self.assertEqual(type(data[0][0]), unicode)
+        self.assertEqual(type(data[0][1]), int)
+        self.assertEqual(type(data[0][2]), int)
+
+    def test_api_conditional_headers(self):
+        """
+        Test caching headers of API responses.
+        """
+        main.app.config.update({'API_MAX_AGE': 60})
+        self.addCleanup(main.app.config.update, {'API_MAX_AGE': 0})
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['ETag'])
+        self.assertTrue(resp.headers['Last-Modified'])
+        self.assertIn('max-age=60', resp.headers['Cache-Control'])
+
+        other = self.client.get('/api/v1/presence_weekday/11')
+        self.assertNotEqual(other.headers['ETag'], resp.headers['ETag'])
+
+    def test_api_if_none_match(self):
+        """
+        Test that request with current ETag gets 304 response.
+        """
+        resp = self.client.get('/api/v1/users')
+        etag = resp.headers['ETag']
+        resp = self.client.get(
+            '/api/v1/users', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, '')
+        self.assertEqual(resp.headers['ETag'], etag)
+
+        resp = self.client.get(
+            '/api/v1/users', headers={'If-None-Match': '"other"'}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_api_if_modified_since(self):
+        """
+        Test that request with current Last-Modified gets 304 response.
+        """
+        resp = self.client.get('/api/v1/mean_time_weekday/10')
+        resp = self.client.get(
+            '/api/v1/mean_time_weekday/10',
+            headers={'If-Modified-Since': resp.headers['Last-Modified']},
+        )
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get(
+            '/api/v1/mean_time_weekday/10',
+            headers={'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'},
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_api_etag_changes_with_data(self):
+        """
+        Test that ETag changes when data file changes.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, path)
+        main.app.config.update({'DATA_CSV': path})
+        etag = self.client.get('/api/v1/presence_weekday/10').headers['ETag']
+
+        with open(path, 'a') as csvfile:
+            csvfile.write('\n10,2013-09-16,09:00:00,17:00:00\n')
+        resp = self.client.get(
+            '/api/v1/presence_weekday/10', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_presence_weekday_view_date_range(self):
+        """
+        Test presence time limited to date range.
+        """
+        resp = self.client.get(
+            '/api/v1/presence_weekday/11?from=2013-09-10&to=2013-09-12'
+        )
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data[1], ['Mon', 0])
+        self.assertEqual(data[2], ['Tue', 16564])
+        self.assertEqual(data[5], ['Fri', 0])
+
+        resp = self.client.get('/api/v1/presence_weekday/11?from=2013-09-10')
+        self.assertEqual(json.loads(resp.data)[5], ['Fri', 6426])
+
+        # empty arguments are unbounded like missing ones
+        resp = self.client.get('/api/v1/presence_weekday/10?from=&to=')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.data, self.client.get('/api/v1/presence_weekday/10').data
+        )
+
+    def test_presence_views_invalid_date_range(self):
+        """
+        Test presence views with invalid date.
+        """
+        for url in ('/api/v1/presence_weekday/10',
+                    '/api/v1/mean_time_weekday/10',
+                    '/api/v1/presence_start_end/10',
+                    '/api/v1/batch'):
+            resp = self.client.get(url + '?to=2013-13-01')
+            self.assertEqual(resp.status_code, 400)
+
+    def test_presence_trend_view(self):
+        """
+        Test weekly presence trend.
+        """
+        resp = self.client.get('/api/v1/presence_trend/11?window=2')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data, [
+            ['2013-09-02', 22999, 22999],
+            ['2013-09-09', 95403, 59201],
+        ])
+
+    def test_presence_trend_view_periods(self):
+        """
+        Test presence trend in monthly and custom periods.
+        """
+        resp = self.client.get('/api/v1/presence_trend/10?period=month')
+        self.assertEqual(json.loads(resp.data), [['2013-09-01', 78217, 78217]])
+        resp = self.client.get(
+            '/api/v1/presence_trend/10?period=2&from=2013-09-09&to=2013-09-12'
+        )
+        self.assertEqual(
+            [row[:2] for row in json.loads(resp.data)],
+            [['2013-09-09', 30047], ['2013-09-11', 48170]],
+        )
+
+    def test_presence_trend_view_invalid(self):
+        """
+        Test presence trend with invalid arguments and unknown user.
+        """
+        self.assertEqual(
+            self.client.get('/api/v1/presence_trend/666').status_code, 404
+        )
+        for query in ('period=year', 'period=0', 'window=0',
+                      'period=1&from=1900-01-01'):
+            resp = self.client.get('/api/v1/presence_trend/10?' + query)
+            self.assertEqual(resp.status_code, 400)
+
+    def test_presence_trend_view_last_day(self):
+        """
+        Test presence trend with periods ending after the last date.
+        """
+        url = '/api/v1/presence_trend/10?from=9999-12-01&to=9999-12-31'
+        for query, first in (('', '9999-11-29'), ('&period=month', None),
+                             ('&period=1000', None)):
+            resp = self.client.get(url + query)
+            self.assertEqual(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertEqual(data[0][0], first or '9999-12-01')
+        self.assertEqual(len(data), 1)
+
+    def test_batch_view(self):
+        """
+        Test batch statistics match per-user endpoints.
+        """
+        resp = self.client.get('/api/v1/batch')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertItemsEqual(data.keys(), ['10', '11'])
+        for metric in ('presence_weekday', 'mean_time_weekday',
+                       'presence_start_end'):
+            single = self.client.get('/api/v1/{0}/11'.format(metric))
+            self.assertEqual(data['11'][metric], json.loads(single.data))
+
+    def test_batch_view_selected(self):
+        """
+        Test batch statistics of selected users and metrics.
+        """
+        resp = self.client.get(
+            '/api/v1/batch?users=11,666&metrics=mean_time_weekday'
+        )
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertItemsEqual(data.keys(), ['11', '666'])
+        self.assertItemsEqual(data['11'].keys(), ['mean_time_weekday'])
+        self.assertIsNone(data['666'])
+
+    def test_batch_view_invalid(self):
+        """
+        Test batch statistics with invalid arguments.
+        """
+        resp = self.client.get('/api/v1/batch?users=abc')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get('/api/v1/batch?metrics=unknown')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_metrics_view(self):
+        """
+        Test timings in Server-Timing header and metrics endpoint.
+        """
+        resp = self.client.get('/api/v1/presence_start_end/10')
+        self.assertNotIn('Server-Timing', resp.headers)
+        self.assertEqual(self.client.get('/api/v1/_metrics').status_code, 404)
+
+        main.app.config.update({'METRICS': True})
+        self.addCleanup(main.app.config.update, {'METRICS': False})
+        self.addCleanup(metrics.reset)
+        metrics.reset()
+        responses.response_cache.clear()  # cached body skips the view
+        resp = self.client.get('/api/v1/presence_start_end/10')
+        timings = [
+            entry.split(';')[0]
+            for entry in resp.headers['Server-Timing'].split(', ')
+        ]
+        self.assertIn('get_user_aggregates', timings)
+        self.assertIn('presence_start_end', timings)
+        self.assertEqual(timings[-2:], ['serialize', 'total'])
+
+        resp = self.client.get('/api/v1/_metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain'))
+        lines = resp.data.splitlines()
+        self.assertIn(
+            '# TYPE presence_analyzer_function_duration_seconds summary',
+            lines
+        )
+        self.assertIn(
+            'presence_analyzer_function_duration_seconds_count'
+            '{function="presence_start_end"} 1',
+            lines
+        )
+        self.assertIn(
+            '# TYPE presence_analyzer_response_cache_hits_total counter',
+            lines
+        )
+        self.assertIn('presence_analyzer_response_cache_entries 1', lines)
+        self.assertIn(
+            'presence_analyzer_request_duration_seconds_count'
+            '{endpoint="presence_start_end"} 1',
+            lines
+        )
+
+    def test_profile_request(self):
+        """
+        Test profiling single request with query argument.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        resp = self.client.get('/api/v1/presence_weekday/10?_profile=text')
+        self.assertEqual(resp.content_type, 'application/json')
+
+        main.app.config.update({'PROFILING': True, 'PROFILE_DIR': tmpdir})
+        self.addCleanup(
+            main.app.config.update, {'PROFILING': False, 'PROFILE_DIR': None}
+        )
+        resp = self.client.get('/api/v1/presence_weekday/10?_profile=1')
+        self.assertEqual(resp.content_type, 'application/json')
+        self.assertEqual(len(os.listdir(tmpdir)), 1)
+        resp = self.client.get('/api/v1/presence_weekday/10?_profile=text')
+        self.assertTrue(resp.content_type.startswith('text/plain'))
+        self.assertIn('presence_weekday', resp.data)
+        self.assertEqual(len(os.listdir(tmpdir)), 2)
+
+    def test_profile_failed_request(self):
+        """
+        Test profiler is stopped and saved when the view raises.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        main.app.config.update({'PROFILING': True, 'PROFILE_DIR': tmpdir})
+        self.addCleanup(
+            main.app.config.update, {'PROFILING': False, 'PROFILE_DIR': None}
+        )
+        resp = self.client.get('/api/v1/user_avatar/666?_profile=1')
+        self.assertEqual(resp.status_code, 500)
+        self.assertIsNone(sys.getprofile())
+        self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+    def test_api_compression(self):
+        """
+        Test gzip and deflate content coding of large responses.
+        """
+        main.app.config.update({'COMPRESS_MIN_SIZE': 100})
+        self.addCleanup(main.app.config.update, {'COMPRESS_MIN_SIZE': 1024})
+        url = '/api/v1/batch?users=10,11&metrics=presence_weekday'
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        plain = resp.data
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn(', ', plain)
+
+        resp = self.client.get(
+            '/api/v1/presence_weekday/10',
+            headers={'Accept-Encoding': 'gzip, deflate'},
+        )
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            zlib.decompress(resp.data, 16 + zlib.MAX_WBITS), plain
+        )
+        etag = resp.headers['ETag']
+
+        resp = self.client.get(
+            '/api/v1/presence_weekday/10',
+            headers={'Accept-Encoding': 'deflate'},
+        )
+        self.assertEqual(resp.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(resp.data), plain)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+        resp = self.client.get(
+            '/api/v1/user_avatar/10', headers={'Accept-Encoding': 'gzip'}
+        )
+        self.assertNotIn('Content-Encoding', resp.headers)
+        batch = self.client.get(url).data
+        for __ in range(2):  # streamed, then from the cache
+            resp = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(
+                zlib.decompress(resp.data, 16 + zlib.MAX_WBITS), batch
+            )
+        self.assertEqual(
+            responses.response_cache.get(resp.get_etag()[0]).data,
+            resp.data,
+        )
+
+    def test_api_response_cache(self):
+        """
+        Test that rendered body is reused until data changes.
+        """
+        def cached():
+            """
+            Returns cached bodies from the least recently used.
+            """
+            entries = responses.response_cache.entries
+            return [entry.value for entry in entries.values()]
+
+        responses.response_cache.clear()
+        resp = self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(len(responses.response_cache), 1)
+        body = cached()[0]
+        self.assertEqual(body.data, resp.data)
+        self.assertEqual(
+            self.client.get('/api/v1/presence_weekday/10').data, resp.data
+        )
+        self.assertIs(cached()[0], body)
+        self.client.get('/api/v1/presence_weekday/666')
+        self.assertEqual(len(responses.response_cache), 1)
+        self.client.get('/api/v1/presence_weekday/11')
+        self.client.get('/api/v1/presence_weekday/10')
+        self.assertIs(cached()[-1], body)
+
+        # bodies of the old data are dropped with new version of the file
+        self.client.get('/api/v1/users')
+        self.assertEqual(len(responses.response_cache), 3)
+        before = responses.response_cache.stats()['invalidations']
+        main.app.config.update({'DATA_CSV': TEST_BROKEN_DATA_CSV})
+        self.client.get('/api/v1/presence_weekday/10')
+        self.assertEqual(len(responses.response_cache), 2)
+        self.assertEqual(
+            responses.response_cache.stats()['invalidations'], before + 2
+        )
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+
+        main.app.config.update({'RESPONSE_CACHE_SIZE': 1})
+        self.addCleanup(
+            main.app.config.update, {'RESPONSE_CACHE_SIZE': 1000}
+        )
+        self.client.get('/api/v1/presence_weekday/11')
+        self.assertEqual(len(responses.response_cache), 1)
+        self.assertIsNot(cached()[0], body)
+
+    def test_render_all_view_mainpage(self):
+        """
+        Test correctness of rendering view from templates.
+        Redirect to default template.
+        """
+        resp = self.client.get('/')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.content_type, 'text/html; charset=utf-8')
+        self.assertIn('Redirecting', resp.data)
+
+    def test_render_all_view_template(self):
+        """
+        Test correctness of rendering view from templates.
+        Check the template name.
+        """
+        resp = self.client.get('/presence_start_end.html')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'text/html; charset=utf-8')
+        self.assertIn('Presence start-end weekday', resp.data)
+
+    def test_render_all_view_template_not_exists(self):
+        """
+        Test correctness of rendering view from templates.
+        Check if render notFound.html.
+        """
+        resp = self.client.get('/template_that_not_exists')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'text/html; charset=utf-8')
+        self.assertIn('ERROR 404', resp.data)
@@ -3,107 +3,401 @@
 Helper functions used in views.
 """
 
-import csv
-
-from json import dumps
-from functools import wraps
-from datetime import datetime
+import calendar
+import datetime
 
 import logging
 
-from lxml import etree
-from flask import Response
 from presence_analyzer.main import app
+from presence_analyzer.columns import (
+    ColumnStore,
+    UserColumns,
+    Timeline,
+    WeekdayIndex,
+)
+from presence_analyzer import metrics, stats
+
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
+# Helpers moved to other modules, which import this one, so they are
+# imported when called.
+# pylint: disable=cyclic-import
+
 def jsonify(function):
     """
-    Creates a response with the JSON representation of wrapped function result.
+    Creates a response with the JSON representation of wrapped function
+    result, see `responses.jsonify`.
     """
-    @wraps(function)
-    def inner(*args, **kwargs):
-        """
-        This docstring will be overridden by @wraps decorator.
-        """
-        return Response(
-            dumps(function(*args, **kwargs)),
-            mimetype='application/json'
-        )
-    return inner
+    from presence_analyzer import responses
+    return responses.jsonify(function)
 
 
 def get_data():
     """
-    Extracts presence data from CSV file and groups it by user_id.
+    Returns presence data grouped by user_id, see `storage.get_data`.
+    """
+    from presence_analyzer import storage
+    return storage.get_data()
 
-    It creates structure like this:
-    data = {
-        'user_id': {
-            datetime.date(2013, 10, 1): {
-                'start': datetime.time(9, 0, 0),
-                'end': datetime.time(17, 30, 0),
-            },
-            datetime.date(2013, 10, 2): {
-                'start': datetime.time(8, 30, 0),
-                'end': datetime.time(16, 45, 0),
-            },
-        }
+
+def get_xml_data():
+    """
+    Returns data about users, see `storage.get_xml_data`.
+    """
+    from presence_analyzer import storage
+    return storage.get_xml_data()
+
+
+@metrics.instrumented
+def build_date_index(data):
+    """
+    Builds `WeekdayIndex` of every user for date range queries.
+    """
+    return {
+        user_id: WeekdayIndex(user_rows(items))
+        for user_id, items in data.iteritems()
+    }
+
+
+@metrics.instrumented
+def build_timelines(data):
+    """
+    Builds `Timeline` of every user for trend queries.
+    """
+    return {
+        user_id: Timeline(user_rows(items))
+        for user_id, items in data.iteritems()
     }
+
+
+MAX_TREND_PERIODS = 5000
+
+
+@metrics.instrumented
+def presence_trend(timeline, first, last, period='week', window=4):
     """
-    data = {}
-    with open(app.config['DATA_CSV'], 'r') as csvfile:
-        presence_reader = csv.reader(csvfile, delimiter=',')
-        for i, row in enumerate(presence_reader):
-            if len(row) != 4:
-                # ignore header and footer lines
-                continue
+    Sums presence time in consecutive periods with rolling average.
+
+    Args:
+        timeline (Timeline): user's timeline.
+        first (datetime.date): first day, the first entry if None.
+        last (datetime.date): last day, the last entry if None.
+        period (str or int): 'week' (starting on Monday), 'month'
+            or number of days.
+        window (int): number of periods in rolling average.
 
-            try:
-                user_id = int(row[0])
-                date = datetime.strptime(row[1], '%Y-%m-%d').date()
-                start = datetime.strptime(row[2], '%H:%M:%S').time()
-                end = datetime.strptime(row[3], '%H:%M:%S').time()
-            except (ValueError, TypeError):
-                log.debug('Problem with line %d: ', i, exc_info=True)
+    Returns:
+        list: (first day of period in ISO format, presence seconds,
+            mean presence seconds of the period and window - 1 preceding
+            periods) tuples.
 
-            data.setdefault(user_id, {})[date] = {'start': start, 'end': end}
+    Raises:
+        ValueError: if there are more than MAX_TREND_PERIODS periods.
+    """
+    if not timeline.days:
+        return []
+    first = first or datetime.date.fromordinal(timeline.days[0])
+    last = last or datetime.date.fromordinal(timeline.days[-1])
+    totals = []
+    for start, end in periods(first, last, period):
+        if len(totals) == MAX_TREND_PERIODS:
+            raise ValueError('More than {0} periods'.format(len(totals)))
+        totals.append(
+            (start, timeline.total(start.toordinal(), end.toordinal()))
+        )
+    result = []
+    window_total = 0
+    for i, (start, total) in enumerate(totals):
+        window_total += total
+        if i >= window:
+            window_total -= totals[i - window][1]
+        result.append((
+            start.isoformat(), total,
+            safe_mean(window_total, min(i + 1, window)),
+        ))
+    return result
 
-    return data
 
+def periods(first, last, period):
+    """
+    Yields (first day, last day) of consecutive periods covering dates
+    from first to last, see `presence_trend`.
+    """
+    if period == 'week':
+        start = first - datetime.timedelta(days=first.weekday())
+    elif period == 'month':
+        start = first.replace(day=1)
+    else:
+        start = first
+    while start <= last:
+        try:
+            if period == 'week':
+                following = start + datetime.timedelta(days=7)
+            elif period == 'month':
+                following = start + datetime.timedelta(days=31)
+                following = following.replace(day=1)
+            else:
+                following = start + datetime.timedelta(days=period)
+        except OverflowError:
+            # the period ends at the last representable day
+            yield start, datetime.date.max
+            return
+        yield start, following - datetime.timedelta(days=1)
+        start = following
+
+
+@metrics.instrumented
+def build_aggregates(data):
+    """
+    Sums presence data of every user by weekday.
 
-def get_xml_data():
+    Args:
+        data (dict): presence data as returned by `storage.get_data`.
+
+    Returns:
+        dict: user_id mapped to result of `weekday_aggregates`.
     """
-    Extracts data about users from XML.
-
-    It creates structure like this:
-    data = {
-        'user_id': {
-            'avatar': 'https://intranet.stxnext.pl/api/images/users/141',
-            'name': 'Adam P.',
-        },
-        'user_id': {
-            'avatar': 'https://intranet.stxnext.pl/api/images/users/176',
-            'name': 'Adrian K.',
-        },
+    if use_numpy():
+        return stats.aggregates(to_columns(data))
+    return {
+        user_id: weekday_aggregates(items)
+        for user_id, items in data.iteritems()
     }
+
+
+def weekday_aggregates(items):
     """
-    data = {}
-    with open(app.config['DATA_XML'], 'r') as xmlfile:
-        xmldata_tree_object = etree.parse(xmlfile)
-        data_xml = xmldata_tree_object.getroot()
-
-        server_data = data_xml.find('server')
-        base_path = '{0}://{1}'.format(
-            server_data.find('protocol').text, server_data.find('host').text)
-        for user in data_xml.find('users'):
-            data[user.get('id')] = {
-                'avatar': '{0}{1}'.format(base_path, user.find('avatar').text),
-                'name': user.find('name').text,
+    Sums presence entries of a single user by weekday.
+
+    Args:
+        items (dict): data structure for user like:
+            {
+                datetime.date(2013, 10, 1): {
+                    'start': datetime.time(9, 0, 0),
+                    'end': datetime.time(17, 30, 0),
+                },
             }
 
-    return data
+    Returns:
+        list: list of weekdays. Each weekday is a list of:
+            [0] - number of entries
+            [1] - total presence time in seconds
+            [2] - sum of seconds from midnight to start
+            [3] - sum of seconds from midnight to end.
+    """
+    result = [[0, 0, 0, 0] for __ in range(7)]  # one list for every day
+    for day, start, end in user_rows(items):
+        weekday = result[ordinal_weekday(day)]
+        weekday[0] += 1
+        weekday[1] += end - start
+        weekday[2] += start
+        weekday[3] += end
+    return result
+
+
+@metrics.instrumented
+def build_summary(data, percentiles=(25, 50, 75, 90)):
+    """
+    Computes statistics of presence intervals of every user by weekday.
+
+    Args:
+        data (dict): presence data as returned by `storage.get_data`.
+        percentiles (tuple): percentiles to compute.
+
+    Returns:
+        dict: user_id mapped to result of `weekday_summary`.
+    """
+    if use_numpy():
+        return stats.summary(to_columns(data), percentiles)
+    return {
+        user_id: weekday_summary(items, percentiles)
+        for user_id, items in data.iteritems()
+    }
+
+
+def weekday_summary(items, percentiles=(25, 50, 75, 90)):
+    """
+    Computes statistics of presence intervals of a single user by weekday.
+
+    Args:
+        items (dict): data structure for user, see `weekday_aggregates`.
+        percentiles (tuple): percentiles to compute.
+
+    Returns:
+        list: list of weekdays. Each weekday is a dict with 'count',
+            'total', 'mean', 'median' and 'percentiles' (dict mapping
+            percentile to value) of intervals in seconds.
+    """
+    grouped = [[] for __ in range(7)]  # one list for every day in week
+    for day, start, end in user_rows(items):
+        grouped[ordinal_weekday(day)].append(end - start)
+    result = []
+    for intervals in grouped:
+        intervals.sort()
+        result.append({
+            'count': len(intervals),
+            'total': sum(intervals),
+            'mean': mean(intervals),
+            'median': percentile(intervals, 50),
+            'percentiles': {
+                percent: percentile(intervals, percent)
+                for percent in percentiles
+            },
+        })
+    return result
+
+
+def use_numpy():
+    """
+    Tells whether statistics should be computed with NumPy.
+    """
+    if app.config['STATS_ENGINE'] != 'numpy':
+        return False
+    if not stats.available():
+        log.warning('STATS_ENGINE is numpy, but NumPy is not installed')
+        return False
+    return True
+
+
+def update_aggregates(aggregates, changes):
+    """
+    Applies changed presence entries to aggregates.
+
+    Args:
+        aggregates (dict): result of `build_aggregates`, not modified.
+        changes (list): (user_id, day ordinal, old (start, end) seconds or
+            None, new (start, end) seconds) tuples.
+
+    Returns:
+        dict: updated copy of aggregates.
+    """
+    result = dict(aggregates)
+    copied = set()
+    for user_id, day, old, new in changes:
+        if user_id not in copied:
+            result[user_id] = [
+                list(weekday)
+                for weekday in aggregates.get(user_id, [[0, 0, 0, 0]] * 7)
+            ]
+            copied.add(user_id)
+        weekday = result[user_id][ordinal_weekday(day)]
+        if old is not None:
+            weekday[0] -= 1
+            weekday[1] -= old[1] - old[0]
+            weekday[2] -= old[0]
+            weekday[3] -= old[1]
+        weekday[0] += 1
+        weekday[1] += new[1] - new[0]
+        weekday[2] += new[0]
+        weekday[3] += new[1]
+    return result
+
+
+DERIVED_UPDATES = {
+    build_aggregates: update_aggregates,
+}
+
+
+@metrics.instrumented
+def mean_time_weekday(weekdays):
+    """
+    Returns mean presence time by weekday.
+
+    Args:
+        weekdays (list): user's aggregates, see `weekday_aggregates`.
+    """
+    return [
+        (calendar.day_abbr[weekday], safe_mean(total, count))
+        for weekday, (count, total, __, __) in enumerate(weekdays)
+    ]
+
+
+@metrics.instrumented
+def presence_weekday(weekdays):
+    """
+    Returns total presence time by weekday, preceded by column labels.
+
+    Args:
+        weekdays (list): user's aggregates, see `weekday_aggregates`.
+    """
+    result = [
+        (calendar.day_abbr[weekday], total)
+        for weekday, (__, total, __, __) in enumerate(weekdays)
+    ]
+    result.insert(0, ('Weekday', 'Presence (s)'))
+    return result
+
+
+@metrics.instrumented
+def presence_start_end(weekdays):
+    """
+    Returns mean start and end time by weekday.
+
+    Args:
+        weekdays (list): user's aggregates, see `weekday_aggregates`.
+    """
+    return [
+        (
+            calendar.day_abbr[weekday],
+            safe_mean(starts, count),
+            safe_mean(ends, count),
+        )
+        for weekday, (count, __, starts, ends) in enumerate(weekdays)
+    ]
+
+
+# names of statistics available in batch API mapped to their functions
+METRICS = {
+    'mean_time_weekday': mean_time_weekday,
+    'presence_weekday': presence_weekday,
+    'presence_start_end': presence_start_end,
+}
+
+
+def user_rows(items):
+    """
+    Returns presence entries of a single user as integer tuples.
+
+    Args:
+        items (dict): data structure for user, see `weekday_aggregates`,
+            or `UserColumns`.
+
+    Returns:
+        iterator: (day ordinal, start seconds, end seconds) tuples.
+    """
+    if isinstance(items, UserColumns):
+        return items.rows()
+    return (
+        (
+            date.toordinal(),
+            seconds_since_midnight(entry['start']),
+            seconds_since_midnight(entry['end']),
+        )
+        for date, entry in items.iteritems()
+    )
+
+
+def to_columns(data):
+    """
+    Converts presence data to `ColumnStore`, unless it already is one.
+    """
+    if isinstance(data, ColumnStore):
+        return data
+    return ColumnStore.from_rows(
+        (user_id,) + row
+        for user_id, items in data.iteritems()
+        for row in user_rows(items)
+    )
+
+
+def ordinal_weekday(day):
+    """
+    Returns weekday (Monday is 0) of the day given as date ordinal.
+    """
+    # ordinal 1 is Monday, January 1 of year 1
+    return (day - 1) % 7
 
 
 def group_by_weekday(items):
@@ -237,3 +531,37 @@ def mean(items):
         float: arithmetic mean.
     """
     return float(sum(items)) / len(items) if len(items) > 0 else 0
+
+
+def percentile(items, percent):
+    """
+    Calculates percentile with linear interpolation between closest ranks,
+    like NumPy does. Returns zero for empty lists.
+
+    Args:
+        items (list): sorted list of numbers.
+        percent (int): percentile between 0 and 100.
+
+    Returns:
+        float: percentile.
+    """
+    if not items:
+        return 0
+    position = (len(items) - 1) * (percent / 100.0)
+    lower = int(position)
+    upper = min(lower + 1, len(items) - 1)
+    return items[lower] + (items[upper] - items[lower]) * (position - lower)
+
+
+def safe_mean(total, count):
+    """
+    Calculates arithmetic mean from sum and count. Returns zero if empty.
+
+    Args:
+        total (int): sum of items.
+        count (int): number of items.
+
+    Returns:
+        float: arithmetic mean.
+    """
+    return float(total) / count if count > 0 else 0
@@ -3,17 +3,37 @@
 Defines views.
 """
 # pylint: disable=unused-wildcard-import, wildcard-import
-import calendar
 import logging
-from flask import redirect, abort, render_template
+import datetime
+from flask import redirect, abort, render_template, request, Response
 from jinja2 import TemplateNotFound
 
 from presence_analyzer.main import app
-from presence_analyzer import utils
+from presence_analyzer import background, metrics, responses, storage, utils
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
+def date_range():
+    """
+    Returns first and last day from 'from' and 'to' query arguments
+    in YYYY-MM-DD format, None for missing or empty ones. Aborts if
+    invalid.
+    """
+    days = []
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        if not value:
+            days.append(None)
+            continue
+        try:
+            days.append(datetime.datetime.strptime(value, '%Y-%m-%d').date())
+        except ValueError:
+            log.debug('Invalid date %s: %s', name, value)
+            abort(400)
+    return days
+
+
 @app.route('/')
 def mainpage():
     """
@@ -23,12 +43,13 @@ def mainpage():
 
 
 @app.route('/api/v1/users', methods=['GET'])
-@utils.jsonify
+@responses.conditional('DATA_XML')
+@responses.jsonify
 def users_view():
     """
     Users listing for dropdown.
     """
-    data = utils.get_xml_data()
+    data = storage.get_storage().users()
 
     return [
         {'user_id': i, 'name': data[i]['name']}
@@ -37,63 +58,173 @@ def users_view():
 
 
 @app.route('/api/v1/mean_time_weekday/<int:user_id>', methods=['GET'])
-@utils.jsonify
+@responses.conditional('DATA_CSV')
+@responses.jsonify
 def mean_time_weekday_view(user_id):
     """
     Returns mean presence time of given user grouped by weekday.
     """
-    data = utils.get_data()
-    if user_id not in data:
+    first, last = date_range()
+    weekdays = storage.get_storage().user_aggregates(user_id, first, last)
+    if weekdays is None:
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    weekdays = utils.group_by_weekday(data[user_id])
-    result = [
-        (calendar.day_abbr[weekday], utils.mean(intervals))
-        for weekday, intervals in enumerate(weekdays)
-    ]
-
-    return result
+    return utils.mean_time_weekday(weekdays)
 
 
 @app.route('/api/v1/presence_weekday/<int:user_id>', methods=['GET'])
-@utils.jsonify
+@responses.conditional('DATA_CSV')
+@responses.jsonify
 def presence_weekday_view(user_id):
     """
     Returns total presence time of given user grouped by weekday.
     """
-    data = utils.get_data()
-    if user_id not in data:
+    first, last = date_range()
+    weekdays = storage.get_storage().user_aggregates(user_id, first, last)
+    if weekdays is None:
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    weekdays = utils.group_by_weekday(data[user_id])
-    result = [
-        (calendar.day_abbr[weekday], sum(intervals))
-        for weekday, intervals in enumerate(weekdays)
-    ]
-
-    result.insert(0, ('Weekday', 'Presence (s)'))
-    return result
+    return utils.presence_weekday(weekdays)
 
 
 @app.route('/api/v1/presence_start_end/<int:user_id>', methods=['GET'])
-@utils.jsonify
+@responses.conditional('DATA_CSV')
+@responses.jsonify
 def presence_start_end(user_id):
     """
     Return presence mean start and end times for given user grouped by weekday.
     """
-    data = utils.get_data()
-    if user_id not in data:
+    first, last = date_range()
+    weekdays = storage.get_storage().user_aggregates(user_id, first, last)
+    if weekdays is None:
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    weekdays = utils.mean_start_stop(data[user_id])
-    result = [
-        (calendar.day_abbr[weekday], day['Start'], day['End'])
-        for weekday, day in enumerate(weekdays)
-    ]
-    return result
+    return utils.presence_start_end(weekdays)
+
+
+@app.route('/api/v1/presence_trend/<int:user_id>', methods=['GET'])
+@responses.conditional('DATA_CSV')
+@responses.jsonify
+def presence_trend_view(user_id):
+    """
+    Returns presence time of given user in consecutive periods.
+
+    Query arguments:
+        period: 'week' (default), 'month' or number of days.
+        window: number of periods in rolling average (default 4).
+        from, to: date range in YYYY-MM-DD format (default all entries).
+    """
+    first, last = date_range()
+    period = request.args.get('period', 'week')
+    try:
+        if period not in ('week', 'month'):
+            period = int(period)
+        window = int(request.args.get('window', 4))
+    except ValueError:
+        log.debug('Invalid trend arguments: %s', request.args)
+        abort(400)
+    if isinstance(period, int) and period < 1 or window < 1:
+        abort(400)
+
+    timeline = storage.get_storage().timeline(user_id)
+    if timeline is None:
+        log.debug('User %s not found!', user_id)
+        abort(404)
+
+    try:
+        return utils.presence_trend(timeline, first, last, period, window)
+    except ValueError:
+        log.debug('Too many periods: %s', request.args)
+        abort(400)
+
+
+@app.route('/api/v1/batch', methods=['GET'])
+@responses.conditional('DATA_CSV')
+def batch_view():
+    """
+    Returns statistics of many users at once.
+
+    Query arguments:
+        users: comma separated user ids or 'all' (default).
+        metrics: comma separated names from `utils.METRICS` (default all).
+        from, to: date range in YYYY-MM-DD format (default unbounded).
+
+    The response is a JSON object mapping user id to object mapping metric
+    name to the result of its endpoint, or null for unknown users. It's
+    streamed user by user.
+    """
+    backend = storage.get_storage()
+    lookup = backend.aggregates_lookup(*date_range())
+    users = request.args.get('users', 'all')
+    names = request.args.get('metrics', ','.join(sorted(utils.METRICS)))
+    try:
+        if users == 'all':
+            user_ids = backend.user_ids()
+        else:
+            user_ids = [int(user_id) for user_id in users.split(',')]
+    except ValueError:
+        log.debug('Invalid users: %s', users)
+        abort(400)
+    names = names.split(',')
+    if not set(names) <= set(utils.METRICS):
+        log.debug('Invalid metrics: %s', names)
+        abort(400)
+
+    def generate():
+        """
+        Yields JSON of the result user by user.
+        """
+        yield '{'
+        for i, user_id in enumerate(user_ids):
+            weekdays = lookup(user_id)
+            if weekdays is None:
+                result = None
+            else:
+                result = {
+                    name: utils.METRICS[name](weekdays)
+                    for name in names
+                }
+            yield '{0}"{1}":{2}'.format(
+                ',' if i else '', user_id, responses.serialize(result)
+            )
+        yield '}'
+
+    return Response(generate(), mimetype='application/json')
+
+
+@app.route('/api/v1/_ready', methods=['GET'])
+def ready_view():
+    """
+    Tells whether data is loaded, with 503 status while it's not or its
+    loading has failed.
+    """
+    ready = background.background.ready.is_set() and \
+        not background.background.failed
+    return Response(
+        responses.serialize({'ready': ready}),
+        status=200 if ready else 503,
+        mimetype='application/json',
+    )
+
+
+@app.route('/api/v1/_metrics', methods=['GET'])
+def metrics_view():
+    """
+    Returns call counts and durations of instrumented functions and
+    requests, and counters of the response cache in Prometheus text
+    format.
+    """
+    if not app.config['METRICS']:
+        abort(404)
+    return Response(
+        metrics.prometheus_text() + metrics.cache_text(
+            'response_cache', responses.response_cache.stats()
+        ),
+        mimetype='text/plain; version=0.0.4',
+    )
 
 
 @app.route('/<string:temp_name>', methods=['GET'])
@@ -108,11 +239,12 @@ def render_all(temp_name):
 
 
 @app.route('/api/v1/user_avatar/<int:user_id>', methods=['GET'])
-@utils.jsonify
+@responses.conditional('DATA_XML')
+@responses.jsonify
 def user_avatar(user_id):
     """
     Return path to users avatar.
     """
-    data = utils.get_xml_data()
+    data = storage.get_storage().users()
     user_id = str(user_id)
     return data[user_id]['avatar']
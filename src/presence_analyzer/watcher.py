@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Watching data files for changes.
+
+`InotifyWatcher` gets events from the Linux kernel through inotify,
+`PollingWatcher` compares file signatures every few seconds where inotify
+is not available. Both run in a daemon thread and call `callback(path)`
+once for a burst of changes, when the file has been quiet for `debounce`
+seconds, so a file rewritten in many writes (like users.xml downloaded
+by cron) is reloaded once. A file changed more often than that, like
+a CSV appended to all the time, is still reloaded every MAX_DEBOUNCES
+times `debounce` seconds.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+log = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# longest time the thread waits before checking whether it's stopped
+TICK = 0.1
+# longest wait for a burst of changes to end, in multiples of debounce
+MAX_DEBOUNCES = 5
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0x800
+IN_CLOEXEC = 0x80000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE
+# wd, mask, cookie, length of name following the struct
+EVENT = struct.Struct('iIII')
+
+
+def load_libc():
+    """
+    Returns libc with inotify functions or None if it has none.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1  # pylint: disable=pointless-statement
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+libc = load_libc()  # pylint: disable=invalid-name
+
+
+class Watcher(object):
+    """
+    Base of watchers, collects changes and calls back when debounced.
+    """
+
+    def __init__(self, paths, callback, debounce=1.0):
+        """
+        Args:
+            paths (list): watched file paths.
+            callback (callable): function called with changed path, see
+                `filesystem_path`.
+            debounce (float): seconds without changes before callback.
+        """
+        self.paths = [filesystem_path(path) for path in paths]
+        self.callback = callback
+        self.debounce = debounce
+        # path mapped to times of the first and the last change of a burst
+        self.pending = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts watching in a daemon thread.
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops watching and waits for the thread.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """
+        Waits for changes and dispatches them until stopped.
+        """
+        while not self.stopped.is_set():
+            self.wait(self.timeout())
+            self.dispatch()
+
+    def wait(self, timeout):
+        """
+        Waits up to `timeout` seconds for changes, calling `changed`.
+        """
+        raise NotImplementedError
+
+    def timeout(self):
+        """
+        Returns seconds until the nearest pending callback, at most TICK.
+        """
+        if not self.pending:
+            return TICK
+        due = min(self.due(path) for path in self.pending) - time.time()
+        return max(0, min(due, TICK))
+
+    def due(self, path):
+        """
+        Returns time of the callback for pending changes of path.
+        """
+        first, last = self.pending[path]
+        return min(
+            last + self.debounce, first + self.debounce * MAX_DEBOUNCES
+        )
+
+    def changed(self, path):
+        """
+        Records change of the watched path.
+        """
+        now = time.time()
+        first, __ = self.pending.get(path, (now, None))
+        self.pending[path] = first, now
+
+    def dispatch(self):
+        """
+        Calls back for paths which have been quiet long enough, or changed
+        for too long.
+        """
+        now = time.time()
+        for path in self.pending.keys():
+            if now >= self.due(path):
+                del self.pending[path]
+                try:
+                    self.callback(path)
+                except Exception:  # pylint: disable=broad-except
+                    log.exception('Handling change of %s failed', path)
+
+
+class PollingWatcher(Watcher):
+    """
+    Watcher comparing signatures of files every `interval` seconds.
+    """
+
+    def __init__(self, paths, callback, debounce=1.0, interval=5.0):
+        super(PollingWatcher, self).__init__(paths, callback, debounce)
+        self.interval = interval
+        self.signatures = {path: signature(path) for path in self.paths}
+        self.checked_at = time.time()
+
+    def wait(self, timeout):
+        if time.time() - self.checked_at < self.interval:
+            self.stopped.wait(timeout)
+            return
+        self.checked_at = time.time()
+        for path in self.paths:
+            current = signature(path)
+            if current != self.signatures[path]:
+                self.signatures[path] = current
+                self.changed(path)
+
+
+class InotifyWatcher(Watcher):
+    """
+    Watcher getting events of directories of the files from inotify.
+    """
+
+    def __init__(self, paths, callback, debounce=1.0):
+        super(InotifyWatcher, self).__init__(paths, callback, debounce)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}  # watch descriptor mapped to directory
+        for directory in set(os.path.dirname(path) for path in self.paths):
+            wd = libc.inotify_add_watch(self.fd, directory, WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), 'Cannot watch', directory)
+            self.directories[wd] = directory
+
+    def run(self):
+        try:
+            super(InotifyWatcher, self).run()
+        finally:
+            os.close(self.fd)
+
+    def wait(self, timeout):
+        readable, __, __ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return
+            raise
+        offset = 0
+        while offset < len(data):
+            wd, __, __, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            path = os.path.join(self.directories.get(wd, ''), name)
+            if path in self.paths:
+                self.changed(path)
+
+
+def filesystem_path(path):
+    """
+    Returns absolute path encoded like names in inotify events.
+    """
+    if isinstance(path, unicode):
+        path = path.encode(sys.getfilesystemencoding() or 'utf-8')
+    return os.path.abspath(path)
+
+
+def signature(path):
+    """
+    Returns (inode, size, mtime) of file or None if it doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime
+
+
+def watch(paths, callback, debounce=1.0, interval=5.0):
+    """
+    Starts watching files with inotify, or by polling every `interval`
+    seconds where it's not available.
+
+    Returns:
+        Watcher: started watcher.
+    """
+    watcher = None
+    if libc is not None:
+        try:
+            watcher = InotifyWatcher(paths, callback, debounce)
+        except OSError:
+            log.warning('Cannot use inotify, polling', exc_info=True)
+    if watcher is None:
+        watcher = PollingWatcher(paths, callback, debounce, interval)
+    watcher.start()
+    return watcher